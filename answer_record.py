@@ -0,0 +1,171 @@
+# -*- coding: utf8 -*-
+""" 問卷作答紀錄 """
+from typing import Dict, Optional, Text, Union
+
+from catalog import question_bank
+
+
+# 作答紀錄欄位 -> 題庫 question_group
+ANSWER_FIELDS = {
+    "answer_record_suitability": "Suitability_analysis",
+    "answer_record_car_insurance": "Car_insurance_planning",
+    "answer_record_life_stage": "Life_stage1",
+    "answer_record_life_stage2": "Life_stage2",
+    "answer_record_guarantee_gap": "guarantee_gap_analysis",
+}
+
+# 汽車保險規劃的選項, 每個選項的作答次數另外累計
+CAR_OPTIONS = ("A", "B", "C", "D", "E")
+
+# 單選題答案為選項字串, 如 "2" 或 "A"; 複選題答案為選項位元遮罩, 選項 n 為第 n-1 位元
+Answer = Union[Text, int]
+
+
+def option_bit(option: Text) -> int:
+    """Bit of a multiple choice option.
+
+    Args:
+        option (Text): option number, e.g. "3"
+
+    Returns:
+        int: bit of the option
+    """
+    return 1 << (int(option) - 1)
+
+
+def load_options(value: Union[Text, int, None]) -> int:
+    """Read selected multiple choice options.
+
+    Args:
+        value (Union[Text, int, None]): bitmask, or option numbers of the old format, e.g. "14"
+
+    Returns:
+        int: bitmask
+    """
+    if isinstance(value, int):
+        return value
+    mask = 0
+    for option in value or "":
+        mask |= option_bit(option)
+    return mask
+
+
+def options_text(mask: int) -> Text:
+    """Option numbers of a bitmask, e.g. 9 -> "14".
+
+    Args:
+        mask (int): bitmask
+
+    Returns:
+        Text: option numbers in ascending order
+    """
+    return "".join(str(bit + 1) for bit in range(mask.bit_length()) if mask >> bit & 1)
+
+
+def options_sum(mask: int) -> int:
+    """Sum of the selected option numbers.
+
+    Args:
+        mask (int): bitmask
+
+    Returns:
+        int: sum of option numbers
+    """
+    return sum(bit + 1 for bit in range(mask.bit_length()) if mask >> bit & 1)
+
+
+def answer_text(answer: Answer) -> Text:
+    """Answer as shown to the user, multiple choice as option numbers.
+
+    Args:
+        answer (Answer): single choice option or bitmask
+
+    Returns:
+        Text: e.g. "2", "A" or "14"
+    """
+    return options_text(answer) if isinstance(answer, int) else answer
+
+
+def _is_multiple(question_group: Text, question_number: Text) -> bool:
+    question = question_bank.get(question_group, question_number)
+    return question is not None and question.get("question_type", "").endswith("_multiple")
+
+
+def load_answers(value: Union[Dict[Text, Answer], Text, None], question_group: Text = None) -> Dict[Text, Answer]:
+    """Read an answer record.
+
+    Records of the old format, e.g. "-1:2-2:3-9:14", are converted; the
+    question bank tells which answers are multiple choice.
+
+    Args:
+        value (Union[Dict[Text, Answer], Text, None]): answer record field of `user-request`
+        question_group (Text, optional): question group of the record, needed for the old format. Defaults to None.
+
+    Returns:
+        Dict[Text, Answer]: question number -> answer, in answering order
+    """
+    if isinstance(value, dict):
+        return value
+    answers = {}
+    for record in (value or "").split("-"):
+        if record == "":
+            continue
+        question_number, _, answer = record.partition(":")
+        if question_group is not None and _is_multiple(question_group, question_number):
+            answers[question_number] = load_options(answer)
+        else:
+            answers[question_number] = answer
+    return answers
+
+
+def add_answer(answers: Dict[Text, Answer], question_number: Text, answer: Answer) -> Dict[Text, Answer]:
+    """New record with one more answer.
+
+    Args:
+        answers (Dict[Text, Answer]): current record, not modified
+        question_number (Text): question number
+        answer (Answer): single choice option or bitmask
+
+    Returns:
+        Dict[Text, Answer]: new record
+    """
+    answers = dict(answers)
+    answers[question_number] = answer
+    return answers
+
+
+def load_option_count(value: Optional[Dict[Text, int]], answers: Dict[Text, Answer]) -> Dict[Text, int]:
+    """Read the option counters of car insurance planning.
+
+    Records started before the counters were kept are counted from the answers.
+
+    Args:
+        value (Optional[Dict[Text, int]]): option counter field of `user-request`
+        answers (Dict[Text, Answer]): answer record of the same questionnaire
+
+    Returns:
+        Dict[Text, int]: option -> number of answers
+    """
+    if isinstance(value, dict):
+        return value
+    option_count = dict.fromkeys(CAR_OPTIONS, 0)
+    for answer in answers.values():
+        if answer in option_count:
+            option_count[answer] += 1
+    return option_count
+
+
+def add_option_count(option_count: Dict[Text, int], option: Text) -> Dict[Text, int]:
+    """New counters with one more answer.
+
+    Args:
+        option_count (Dict[Text, int]): current counters, not modified
+        option (Text): answered option
+
+    Returns:
+        Dict[Text, int]: new counters
+    """
+    option_count = dict(option_count)
+    if option in option_count:
+        option_count[option] += 1
+    return option_count
@@ -0,0 +1,157 @@
+# -*- coding: utf8 -*-
+""" Flex 模板組裝效能比較: copy.deepcopy 與 flex_builder.fill
+
+執行:
+    python benchmarks/flex_render.py
+"""
+import argparse
+import copy
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flex_builder import fill  # noqa: E402
+from guarantee_gap_template import base_template, title_module, options_module, calculate_result_module  # noqa: E402
+from joint_financial_planning_template import base_question_module, totle_result_module, insurance_description_module  # noqa: E402
+
+
+match_result = {
+    "type_name": "青壯年", "insurance_list": "壽險,醫療險,意外險", "guarantee_direction": "家庭保障",
+    "cost": 30000, "instruction_a": "壽險 保障家人", "instruction_b": "醫療險 住院醫療",
+    "instruction_c": "意外險 意外事故", "instruction_d": "失能險 失能收入", "instruction_e": "癌症險 癌症治療"}
+question = {"description": "請問您的年齡？", "answer_sum": "4", "answer1": "20 歲以下",
+            "answer2": "21 ~ 40 歲", "answer3": "41 ~ 60 歲", "answer4": "61 歲以上"}
+
+
+def question_deepcopy():
+    content = copy.deepcopy(base_template)
+    content["hero"] = copy.deepcopy(title_module)
+    content['hero']['contents'][1]['text'] = question['description']
+    body_content = []
+    for ans_num in range(int(question['answer_sum'])):
+        option = copy.deepcopy(options_module)
+        option['action']['label'] = question['answer' + str(ans_num + 1)]
+        option['action']['data'] = str({
+            "group": "Guarantee_gap", "question_number": "18", "answer_number": str(ans_num + 1)})
+        option['action']['displayText'] = question['answer' + str(ans_num + 1)]
+        body_content.append(option)
+    content['body']['contents'] = body_content
+    return content
+
+
+def question_fill():
+    body_content = []
+    for ans_num in range(int(question['answer_sum'])):
+        body_content.append(fill(options_module, {
+            ('action', 'label'): question['answer' + str(ans_num + 1)],
+            ('action', 'data'): str({
+                "group": "Guarantee_gap", "question_number": "18", "answer_number": str(ans_num + 1)}),
+            ('action', 'displayText'): question['answer' + str(ans_num + 1)]}))
+    return fill(base_template, {
+        ("hero",): fill(title_module, {('contents', 1, 'text'): question['description']}),
+        ('body', 'contents'): body_content})
+
+
+def calculate_result_deepcopy():
+    body_content = []
+    for sign, name, value in (("", "現金需求", 500), ("+", "生活費用", 300), ("-", "已準備", 200), ("", "保障缺口", 600)):
+        result = copy.deepcopy(calculate_result_module)
+        result['contents'][0]['text'] = sign or result['contents'][0]['text']
+        result['contents'][1]['text'] = name
+        result['contents'][2]['text'] = str(value)
+        body_content.append(result)
+    return body_content
+
+
+def calculate_result_fill():
+    return [fill(calculate_result_module, {
+        ('contents', 0, 'text'): sign or calculate_result_module['contents'][0]['text'],
+        ('contents', 1, 'text'): name,
+        ('contents', 2, 'text'): str(value)})
+        for sign, name, value in (("", "現金需求", 500), ("+", "生活費用", 300), ("-", "已準備", 200), ("", "保障缺口", 600))]
+
+
+def result_deepcopy():
+    insurance_content = copy.deepcopy(base_question_module)
+    insurance_content['hero']['contents'][1]['text'] = "保險說明"
+    insurance_body = copy.deepcopy(totle_result_module)
+    insurance_body["contents"][0]["contents"][1]["text"] = match_result["type_name"]
+    insurance_body["contents"][2]["contents"][1]["text"] = match_result["insurance_list"].replace(",", "、")
+    insurance_body["contents"][4]["contents"][1]["text"] = match_result["guarantee_direction"]
+    insurance_body["contents"][6]["contents"][1]["text"] = str(match_result["cost"])
+    for index, instruction in enumerate([match_result["instruction_" + key] for key in "abcde"]):
+        instruction_module = copy.deepcopy(insurance_description_module)
+        instruction_module["contents"][0]["text"] = instruction
+        if (index % 2) == 1:
+            instruction_module["backgroundColor"] = "#00000022"
+        insurance_body["contents"][8]["contents"].append(instruction_module)
+    insurance_content['body'] = insurance_body
+    return insurance_content
+
+
+def result_fill():
+    instruction_modules = list(totle_result_module["contents"][8]["contents"])
+    for index, instruction in enumerate([match_result["instruction_" + key] for key in "abcde"]):
+        instruction_slots = {("contents", 0, "text"): instruction}
+        if (index % 2) == 1:
+            instruction_slots[("backgroundColor",)] = "#00000022"
+        instruction_modules.append(fill(insurance_description_module, instruction_slots))
+    insurance_body = fill(totle_result_module, {
+        ("contents", 0, "contents", 1, "text"): match_result["type_name"],
+        ("contents", 2, "contents", 1, "text"): match_result["insurance_list"].replace(",", "、"),
+        ("contents", 4, "contents", 1, "text"): match_result["guarantee_direction"],
+        ("contents", 6, "contents", 1, "text"): str(match_result["cost"]),
+        ("contents", 8, "contents"): instruction_modules})
+    return fill(base_question_module, {
+        ('hero', 'contents', 1, 'text'): "保險說明",
+        ('body',): insurance_body})
+
+
+CASES = {
+    "guarantee_gap question": (question_deepcopy, question_fill),
+    "guarantee_gap calculate result": (calculate_result_deepcopy, calculate_result_fill),
+    "joint_financial result": (result_deepcopy, result_fill),
+}
+
+
+def allocation(func, renders: int):
+    """Blocks and bytes allocated per render, measured on kept results."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = [func() for _ in range(renders)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    del results
+    return blocks / renders, size / renders
+
+
+def run(number: int):
+    rows = []
+    for name, (before, after) in CASES.items():
+        assert before() == after(), name
+        row = {"case": name}
+        for label, func in (("deepcopy", before), ("fill", after)):
+            seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+            blocks, size = allocation(func, 200)
+            row[label] = {"us_per_render": seconds * 1e6,
+                          "blocks_per_render": blocks, "bytes_per_render": size}
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000,
+                        help="renders per timing run")
+    args = parser.parse_args()
+    for row in run(args.number):
+        print(row["case"])
+        for label in ("deepcopy", "fill"):
+            print("  {:<9}{:>9.1f} us {:>8.1f} blocks {:>9.0f} bytes".format(
+                label, row[label]["us_per_render"], row[label]["blocks_per_render"], row[label]["bytes_per_render"]))
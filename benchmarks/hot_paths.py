@@ -0,0 +1,197 @@
+# -*- coding: utf8 -*-
+""" 計算與訊息組裝熱點的效能基準, 結果寫成 JSON 供前後比較
+
+以 DB/*.json 的資料 (STORAGE_BACKEND=local) 執行, 不連線 LINE, MongoDB 與 SMTP.
+每個項目以 timeit 重複量測, 記錄每次呼叫的最小值, 中位數與標準差.
+
+執行:
+    python benchmarks/hot_paths.py --output before.json
+    python benchmarks/hot_paths.py --output after.json --compare before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 結果檔案路徑相對於執行時的目錄
+CWD = os.getcwd()
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ.setdefault("Channel_Access_Token", "benchmark-token")
+os.environ.setdefault("Channel_Secret", "benchmark-secret")
+
+import app as webhook  # noqa: E402
+from catalog import insurance_advice, question_bank  # noqa: E402
+from database import dbUserRequest  # noqa: E402
+from guarantee_gap import Guarantee_gap  # noqa: E402
+from joint_financial_planning import Joint_financial, report_template  # noqa: E402
+from local_store import load_json  # noqa: E402
+from message import Result_template, function_list  # noqa: E402
+
+
+class StubMail():
+    """Keeps the last message instead of sending it."""
+
+    message = None
+
+    def send(self, message):
+        StubMail.message = message
+
+
+GUARANTEE_GAP_USER = "Ubenchmark-guarantee-gap"
+JOINT_FINANCIAL_USER = "Ubenchmark-joint-financial"
+
+
+def joint_financial_data():
+    # DB/ 中第一筆退休財務規劃, 補上投資與信箱欄位
+    for document in load_json(os.path.join("DB", "user-request.json")):
+        if document.get("status") == "Joint_financial_planning":
+            break
+    user_data = {field: document[field] for field in Joint_financial.financial_data
+                 if field in document}
+    user_data.update({"gender": document["gender"], "kid": document["kid"], "staging": "20",
+                      "rate": "3", "PMT": "12", "email": "benchmark@example.com"})
+    return user_data
+
+
+def guarantee_gap_answers():
+    # 每題選擇中間的選項, 婚姻, 小孩與年齡選擇有保險說明的組合, 三則訊息都會產生
+    answers = {}
+    number = "1"
+    while True:
+        question = question_bank.get("guarantee_gap_analysis", number)
+        if question is None:
+            break
+        answers[number] = str((int(question["answer_sum"]) + 1) // 2)
+        number = str(int(number) + 1)
+    answers.update({"1": "1", "3": "1", "18": "2"})
+    return answers
+
+
+def result_text():
+    # 適合性分析結果的回覆文字
+    advice = insurance_advice.find_one({"insurance_group": "life_stage1_result", "age": "年齡0-2歲"})
+    lines = ["加總分數：28", "投資屬性：穩健型", "人生階段：" + advice["type_name"],
+             "適用人群：" + advice["guarantee_direction"]]
+    for number in ("1", "2", "3"):
+        question = question_bank.get("Suitability_analysis", number)
+        lines += ["題目:" + question["description"], "選項:" + question["answer1"], ""]
+    lines += ["其他保險建議：" + advice["insurance_list"], "網址：" + advice["link_1"], "保費：3000"]
+    return "\n".join(lines) + "\n"
+
+
+def setup():
+    dbUserRequest.update_one({"user_id": GUARANTEE_GAP_USER, "status": "Guarantee_gap_analysis"},
+                             {"$set": {"answer_record_guarantee_gap": guarantee_gap_answers(),
+                                       "question_number": "0"}}, upsert=True)
+    dbUserRequest.update_one({"user_id": JOINT_FINANCIAL_USER, "status": "Joint_financial_planning"},
+                             {"$set": dict(joint_financial_data(), question_number="0")}, upsert=True)
+
+
+def cases():
+    user_data = joint_financial_data()
+    reply = result_text()
+    mail = StubMail()
+    context = webhook.app.app_context()
+    context.push()
+    yield "joint_financial total_assets 10y", lambda: Joint_financial.total_assets(user_data, 10)
+    yield "joint_financial total_assets 30y", lambda: Joint_financial.total_assets(user_data, 30)
+    yield "joint_financial total_assets 60y", lambda: Joint_financial.total_assets(user_data, 60)
+    yield "joint_financial calculate_invest_result", lambda: Joint_financial.calculate_invest_result(user_data)
+    yield "joint_financial send_result", lambda: Joint_financial.send_result(
+        JOINT_FINANCIAL_USER, mail, send_mail=False)
+    yield "joint_financial mail_report xlsx", lambda: Joint_financial.mail_report(user_data, mail)
+    yield "guarantee_gap render_result_template", lambda: Guarantee_gap.render_result_template(GUARANTEE_GAP_USER)
+    yield "Result_template content", lambda: Result_template(reply).content(
+        "適合性分析結果", "https://i.imgur.com/xn6DBGB.png")
+    yield "function_list content", lambda: function_list().content()
+    yield "fuzzy_search_bubble match", lambda: webhook.fuzzy_search_bubble("保險規劃")
+    yield "fuzzy_search_bubble miss", lambda: webhook.fuzzy_search_bubble("哈囉")
+
+
+def measure(func, min_time, repeat):
+    # 每輪至少執行 min_time 秒, 取每次呼叫的時間
+    number, _ = timeit.Timer(func).autorange()
+    number = max(1, int(number * min_time / 0.2))
+    times = [seconds / number for seconds in timeit.repeat(func, number=number, repeat=repeat)]
+    return {"number": number, "repeat": repeat,
+            "min_us": min(times) * 1e6, "median_us": statistics.median(times) * 1e6,
+            "stdev_us": statistics.stdev(times) * 1e6 if repeat > 1 else 0.0}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(min_time=0.2, repeat=5, only=None):
+    setup()
+    # 預熱快取與樣板
+    report_template.render({})
+    results = {}
+    for name, func in cases():
+        if only and not any(word in name for word in only):
+            continue
+        func()
+        results[name] = measure(func, min_time, repeat)
+    return {"meta": {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+                     "revision": git_revision(), "python": platform.python_version(),
+                     "platform": platform.platform()},
+            "benchmarks": results}
+
+
+def compare(results, baseline):
+    """Median of every benchmark against the baseline run.
+
+    Args:
+        results (dict): result of `run`
+        baseline (dict): result of an earlier `run`
+
+    Returns:
+        dict: benchmark name -> median / baseline median
+    """
+    return {name: row["median_us"] / baseline["benchmarks"][name]["median_us"]
+            for name, row in results["benchmarks"].items()
+            if name in baseline["benchmarks"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", metavar="PATH", default="hot_paths.json",
+                        help="JSON results file")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="JSON results of an earlier run")
+    parser.add_argument("--max-ratio", type=float,
+                        help="exit 1 if a median is this many times the earlier run")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timing runs per benchmark")
+    parser.add_argument("--only", action="append",
+                        help="run benchmarks whose name contains this text")
+    args = parser.parse_args()
+    results = run(args.min_time, args.repeat, args.only)
+    with open(os.path.join(CWD, args.output), "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+    ratios = {}
+    if args.compare:
+        with open(os.path.join(CWD, args.compare), encoding="utf-8") as file:
+            ratios = compare(results, json.load(file))
+    print("{:<42}{:>12}{:>12}{:>10}".format("benchmark", "median us", "stdev us", "ratio"))
+    for name, row in results["benchmarks"].items():
+        ratio = "{:.2f}x".format(ratios[name]) if name in ratios else ""
+        print("{:<42}{:>12.1f}{:>12.1f}{:>10}".format(name, row["median_us"], row["stdev_us"], ratio))
+    print("written to", args.output)
+    if args.max_ratio and any(ratio > args.max_ratio for ratio in ratios.values()):
+        sys.exit(1)
@@ -0,0 +1,172 @@
+# -*- coding: utf8 -*-
+""" 回覆訊息效能比較: SDK FlexSendMessage 與 RawFlexSendMessage
+
+不連線 LINE, 以假的 HttpClient 取得請求內容, 計時從建立訊息到產生請求內容.
+開始前確認每個 RawFlexSendMessage 樣板與 SDK 轉換後的內容相同 (adjustMode 除外),
+題目樣板由 DB/*.json 製作 (STORAGE_BACKEND=local)
+
+執行:
+    python benchmarks/line_reply.py
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ["STORAGE_BACKEND"] = "local"
+
+from linebot import LineBotApi  # noqa: E402
+from linebot.http_client import HttpClient  # noqa: E402
+from linebot.models import FlexSendMessage  # noqa: E402
+
+from catalog import question_bank  # noqa: E402
+from flex_builder import fill  # noqa: E402
+from flex_render import question_fill, result_fill, calculate_result_fill  # noqa: E402
+from guarantee_gap import Guarantee_gap  # noqa: E402
+from guarantee_gap_template import base_template, insurance_advice_module  # noqa: E402
+from line_api import RawFlexSendMessage, RawLineBotApi  # noqa: E402
+from message import Car_insurance_planning, Life_stage1, Life_stage2, Suitability_analysis, function_list  # noqa: E402
+
+
+class StubResponse():
+    status_code = 200
+    headers = {}
+
+
+class StubHttpClient(HttpClient):
+    """Keeps the last request body instead of sending it."""
+
+    body = None
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        StubHttpClient.body = data
+        return StubResponse()
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        raise NotImplementedError
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        raise NotImplementedError
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        raise NotImplementedError
+
+
+def sdk_normalized(contents):
+    # SDK 1.19 的模型會略過部分屬性 (如 text 的 adjustMode), 先經 SDK 轉換一次, 兩種方式送出的內容相同
+    return FlexSendMessage(alt_text="x", contents=contents).as_json_dict()["contents"]
+
+
+def without_adjust_mode(node):
+    # SDK 1.19 只保留按鈕的 adjustMode, 此屬性不列入比較
+    if isinstance(node, dict):
+        return {key: without_adjust_mode(value) for key, value in node.items() if key != "adjustMode"}
+    if isinstance(node, list):
+        return [without_adjust_mode(value) for value in node]
+    return node
+
+
+def question_templates():
+    # 每個題目的題目樣板
+    for group, render in (("Suitability_analysis", Suitability_analysis.render),
+                          ("Car_insurance_planning", Car_insurance_planning.render),
+                          ("Life_stage1", Life_stage1.render),
+                          ("Life_stage2", Life_stage2.render),
+                          ("guarantee_gap_analysis", Guarantee_gap.build_question_template)):
+        number = 1
+        while True:
+            question = question_bank.get(group, str(number))
+            if question is None:
+                break
+            yield f"{group} {number}", render(question)
+            number += 1
+
+
+def raw_templates():
+    yield "function_list", function_list().content()
+    yield from question_templates()
+    yield "guarantee_gap result", RawFlexSendMessage(
+        alt_text="保障缺口計算", contents=fill(base_template, {('body', 'contents'): calculate_result_fill()}))
+
+
+def check_raw_templates():
+    """Every RawFlexSendMessage template sends what the SDK would send, apart from adjustMode."""
+    checked = 0
+    for name, message in raw_templates():
+        raw = message.as_json_dict()
+        sdk = FlexSendMessage(alt_text=raw["altText"], contents=raw["contents"]).as_json_dict()
+        assert without_adjust_mode(raw) == without_adjust_mode(sdk), name
+        checked += 1
+    return checked
+
+
+CASES = {
+    "function_list carousel": [
+        ("hello", function_list().content().as_json_dict()["contents"])],
+    "guarantee_gap question": [("保障缺口計算", question_fill())],
+    "guarantee_gap result x3": [
+        ("保障缺口計算", fill(base_template, {('body', 'contents'): calculate_result_fill()})),
+        ("推薦險種", fill(base_template, {('body', 'contents'): [insurance_advice_module] * 6})),
+        ("保險說明", result_fill())],
+}
+CASES = {name: [(alt_text, sdk_normalized(contents)) for alt_text, contents in messages]
+         for name, messages in CASES.items()}
+
+sdk_api = LineBotApi("token", http_client=StubHttpClient)
+raw_api = RawLineBotApi("token", http_client=StubHttpClient)
+
+
+def reply_sdk(messages):
+    sdk_api.reply_message("reply-token", [FlexSendMessage(alt_text=alt_text, contents=contents)
+                                          for alt_text, contents in messages])
+    return StubHttpClient.body
+
+
+def reply_raw(messages):
+    raw_api.reply_message("reply-token", [RawFlexSendMessage(alt_text=alt_text, contents=contents)
+                                          for alt_text, contents in messages])
+    return StubHttpClient.body
+
+
+def reply_cached(messages, prebuilt={}):
+    # 已快取的訊息 (如題目訊息) 只需要組合請求內容
+    key = id(messages)
+    if key not in prebuilt:
+        prebuilt[key] = [RawFlexSendMessage(alt_text=alt_text, contents=contents)
+                         for alt_text, contents in messages]
+    raw_api.reply_message("reply-token", prebuilt[key])
+    return StubHttpClient.body
+
+
+PATHS = (("sdk", reply_sdk), ("raw", reply_raw), ("raw cached", reply_cached))
+
+
+def run(number: int):
+    check_raw_templates()
+    rows = []
+    for name, messages in CASES.items():
+        sdk_body = json.loads(reply_sdk(messages))
+        assert json.loads(reply_raw(messages)) == sdk_body, name
+        assert json.loads(reply_cached(messages)) == sdk_body, name
+        row = {"case": name, "sdk_bytes": len(reply_sdk(messages)),
+               "raw_bytes": len(reply_raw(messages))}
+        for label, func in PATHS:
+            seconds = min(timeit.repeat(lambda: func(messages), number=number, repeat=5)) / number
+            row[label] = {"us_per_reply": seconds * 1e6}
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=500,
+                        help="replies per timing run")
+    args = parser.parse_args()
+    for row in run(args.number):
+        print("{} (body {} -> {} bytes)".format(row["case"], row["sdk_bytes"], row["raw_bytes"]))
+        for label, _ in PATHS:
+            print("  {:<11}{:>9.1f} us".format(label, row[label]["us_per_reply"]))
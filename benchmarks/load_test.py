@@ -0,0 +1,298 @@
+# -*- coding: utf8 -*-
+""" Webhook 壓力測試: 以簽章正確的事件重播完整流程, 統計各意圖延遲與吞吐量
+
+不連線 LINE, MongoDB 與 SMTP:
+    LINE 回覆 API -- 本機 HTTP 伺服器, 收到回覆即完成一個事件
+    MongoDB -- 本機記憶體資料庫 (STORAGE_BACKEND=local, 由 DB/*.json 載入)
+    SMTP -- Flask-Mail 不寄出, 背景工作寫入暫存 SQLite 檔
+
+執行:
+    python benchmarks/load_test.py --users 50 --concurrency 8
+"""
+import argparse
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ.setdefault("Channel_Access_Token", "load-test-token")
+os.environ.setdefault("Channel_Secret", "load-test-secret")
+
+import app as webhook  # noqa: E402
+from catalog import question_bank  # noqa: E402
+from jobs import job_queue  # noqa: E402
+
+
+class StubLineApi(BaseHTTPRequestHandler):
+    """Accepts reply and push calls and wakes the waiting virtual user."""
+
+    replies = {}
+    waiters = {}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+        token = body.get("replyToken")
+        if token is not None:
+            with StubLineApi.lock:
+                StubLineApi.replies[token] = body["messages"]
+                waiter = StubLineApi.waiters.get(token)
+            if waiter is not None:
+                waiter.set()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def signed_body(events):
+    body = json.dumps({"destination": "Uload", "events": events},
+                      ensure_ascii=False).encode("utf-8")
+    signature = base64.b64encode(hmac.new(os.environ["Channel_Secret"].encode("utf-8"),
+                                          body, hashlib.sha256).digest()).decode("ascii")
+    return body, signature
+
+
+def text_event(user_id, text, reply_token):
+    return {"type": "message", "mode": "active", "timestamp": int(time.time() * 1000),
+            "source": {"type": "user", "userId": user_id}, "replyToken": reply_token,
+            "webhookEventId": reply_token, "deliveryContext": {"isRedelivery": False},
+            "message": {"type": "text", "id": reply_token, "text": text}}
+
+
+def postback_event(user_id, data, reply_token):
+    return {"type": "postback", "mode": "active", "timestamp": int(time.time() * 1000),
+            "source": {"type": "user", "userId": user_id}, "replyToken": reply_token,
+            "webhookEventId": reply_token, "deliveryContext": {"isRedelivery": False},
+            "postback": {"data": data}}
+
+
+def postback_actions(messages, tag):
+    # 回覆中所有屬於該功能的 postback 按鈕
+    found = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            action = node.get("action")
+            if isinstance(action, dict) and action.get("type") == "postback" and f"|{tag}|" in action.get("data", ""):
+                found.append(action["data"])
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+    walk(messages)
+    return found
+
+
+def questions(group, first="1"):
+    # 依題號順序直到最後一題
+    question = question_bank.get(group, first)
+    while question is not None:
+        yield question
+        if question.get("final_question") == "1":
+            return
+        question = question_bank.get(group, str(int(question["question_number"]) + 1))
+
+
+def choice_steps(group, rng, options="12345"):
+    steps = []
+    for question in questions(group):
+        number = str(question["question_number"])
+        answers = [str(option) for option in options[:int(question.get("answer_sum") or 1)]] or ["1"]
+        if question.get("question_type", "").endswith("_multiple"):
+            for option in rng.sample(answers, min(2, len(answers))):
+                steps.append(("answer", f"ans:{number}-{option}"))
+            steps.append(("answer", f"ans:{number}-[確定]"))
+        else:
+            steps.append(("answer", f"ans:{number}-{rng.choice(answers)}"))
+    return steps
+
+
+# 退休財務規劃各欄位的輸入
+JOINT_FINANCIAL_INPUT = {"age": "35", "gender": "男", "kid": "1位", "ROI": "5", "CPI": "2",
+                         "investable_amount": "100", "salary": "80", "income": "10", "cost": "30",
+                         "loan": "12", "expenditure": "5", "staging": "20", "rate": "3", "PMT": "10",
+                         "email": "load@example.com"}
+
+
+def flow_suitability(rng):
+    return [("start", "適合性分析")] + choice_steps("Suitability_analysis", rng) + [("result", "適合性分析結果")]
+
+
+def flow_car_insurance(rng):
+    steps = [("start", "汽車保險規劃")]
+    for question in questions("Car_insurance_planning"):
+        options = "ABCDE"[:int(question.get("answer_sum") or 1)]
+        steps.append(("answer", f"ans:{question['question_number']}-{rng.choice(options)}"))
+    return steps + [("result", "汽車保險規劃結果")]
+
+
+def flow_life_stage(rng):
+    return [("start", "人生保險規劃")] + choice_steps("Life_stage1", rng) + [("result", "人生保險規劃紀錄")]
+
+
+def flow_joint_financial(rng):
+    steps = [("start", "退休財務規劃")]
+    question = question_bank.get_by_field("joint_financial_planning", "age")
+    for question in questions("joint_financial_planning", question["question_number"]):
+        steps.append(("input", JOINT_FINANCIAL_INPUT.get(question["field_name"], "1")))
+    return steps + [("result", "退休財務紀錄")]
+
+
+# 保障缺口分析依回覆中的按鈕作答, 其他流程事先排好
+FLOWS = {
+    "suitability": flow_suitability,
+    "car_insurance": flow_car_insurance,
+    "life_stage": flow_life_stage,
+    "guarantee_gap": None,
+    "joint_financial": flow_joint_financial,
+}
+
+
+class VirtualUser():
+    """Sends the events of one user in order, one at a time like a person."""
+
+    def __init__(self, client, user_id, rng, timeout):
+        self.client = client
+        self.user_id = user_id
+        self.rng = rng
+        self.timeout = timeout
+        self.samples = []
+
+    def send(self, label, event):
+        token = event["replyToken"]
+        waiter = threading.Event()
+        with StubLineApi.lock:
+            StubLineApi.waiters[token] = waiter
+        body, signature = signed_body([event])
+        started = time.perf_counter()
+        response = self.client.post("/callback", data=body, headers={
+            "X-Line-Signature": signature, "Content-Type": "application/json"})
+        acked = time.perf_counter()
+        replied = waiter.wait(self.timeout)
+        finished = time.perf_counter()
+        with StubLineApi.lock:
+            StubLineApi.waiters.pop(token, None)
+            messages = StubLineApi.replies.pop(token, None)
+        self.samples.append({"intent": label, "status": response.status_code, "replied": replied,
+                             "ack": acked - started, "latency": finished - started})
+        return messages
+
+    def text(self, flow, step, text):
+        return self.send(f"{flow}:{step}", text_event(self.user_id, text, uuid.uuid4().hex))
+
+    def run(self, flow):
+        if flow == "guarantee_gap":
+            messages = self.text(flow, "start", "保障缺口分析")
+            while True:
+                choices = postback_actions(messages or [], "gg")
+                if not choices:
+                    break
+                messages = self.send(f"{flow}:postback", postback_event(
+                    self.user_id, self.rng.choice(choices), uuid.uuid4().hex))
+            self.text(flow, "result", "保障缺口紀錄")
+            return
+        for step, text in FLOWS[flow](self.rng):
+            self.text(flow, step, text)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(samples, elapsed):
+    groups = collections.defaultdict(list)
+    for sample in samples:
+        groups[sample["intent"]].append(sample)
+        groups["all"].append(sample)
+    rows = []
+    for intent in sorted(groups, key=lambda intent: (intent == "all", intent)):
+        group = groups[intent]
+        latencies = [sample["latency"] * 1000 for sample in group]
+        rows.append({
+            "intent": intent, "events": len(group), "events_per_s": len(group) / elapsed,
+            "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "ack_p50_ms": percentile([sample["ack"] * 1000 for sample in group], 50),
+            "errors": sum(1 for sample in group if sample["status"] != 200 or not sample["replied"])})
+    return rows
+
+
+def run(users, concurrency, flows, seed, timeout):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLineApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    webhook.line_bot_api.endpoint = "http://127.0.0.1:{}".format(server.server_address[1])
+    webhook.app.extensions["mail"].suppress = True
+    job_queue.path = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+
+    def user_session(index):
+        user = VirtualUser(webhook.app.test_client(), f"Uload{index:05d}",
+                           random.Random(seed + index), timeout)
+        for flow in flows:
+            user.run(flow)
+        return user.samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(user_session, range(users)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    samples = [sample for result in results for sample in result]
+    return {"users": users, "concurrency": concurrency, "seconds": elapsed,
+            "intents": summarize(samples, elapsed)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50,
+                        help="virtual users, each runs every flow once")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="users sending events at the same time")
+    parser.add_argument("--flows", default=",".join(FLOWS),
+                        help="comma separated flows: " + ", ".join(FLOWS))
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the random answers")
+    parser.add_argument("--timeout", type=float, default=10,
+                        help="seconds to wait for a reply")
+    parser.add_argument("--json", metavar="PATH",
+                        help="also write the results as JSON")
+    args = parser.parse_args()
+    flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        parser.error("unknown flows: " + ", ".join(sorted(unknown)))
+    result = run(args.users, args.concurrency, flows, args.seed, args.timeout)
+    print("{} users, concurrency {}, {:.1f} s".format(
+        result["users"], result["concurrency"], result["seconds"]))
+    print("{:<28}{:>8}{:>10}{:>10}{:>10}{:>10}{:>8}".format(
+        "intent", "events", "events/s", "p50 ms", "p95 ms", "p99 ms", "errors"))
+    for row in result["intents"]:
+        print("{:<28}{:>8}{:>10.1f}{:>10.2f}{:>10.2f}{:>10.2f}{:>8}".format(
+            row["intent"], row["events"], row["events_per_s"], row["p50_ms"],
+            row["p95_ms"], row["p99_ms"], row["errors"]))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,541 @@
+# -*- coding: utf8 -*-
+""" 靜態資料快取 """
+import bisect
+import configparser
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Text
+
+from database import dbAdvice, dbCar_insurance, dbInsurance, dbQuestion
+from metrics import timed
+
+
+# config 環境設定解析
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCache():
+    """
+    class:
+        ReferenceCache -- Process local copy of a small, rarely changed collection
+
+        The whole collection is read on first use, or by `load_all` before
+        the first event, and read again after `ttl` seconds. While one thread
+        reloads, the other threads keep using the current tables instead of
+        waiting. Subclasses build their lookup tables in `build`.
+
+        attribute:
+            generation (int):
+                Increased every time the data is reloaded.
+
+        method:
+            ensure_loaded() -> None:
+                Load the collection if it was never loaded or the ttl expired.
+
+            refresh() -> None:
+                Load the collection now.
+
+            invalidate() -> None:
+                Load the collection again on next use.
+    """
+
+    def __init__(self, collection, ttl: float = 300):
+        """
+        Args:
+            collection (Collection): collection to copy
+            ttl (float, optional): seconds before the data is loaded again, 0 means never. Defaults to 300.
+        """
+        self.collection = collection
+        self.ttl = ttl
+        self.generation = 0
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def build(self, documents: List[Dict]) -> None:
+        """Build lookup tables from all documents of the collection.
+
+        Args:
+            documents (List[Dict]): documents of the collection
+        """
+        raise NotImplementedError
+
+    def _expired(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return self.ttl > 0 and time.monotonic() - self._loaded_at >= self.ttl
+
+    def ensure_loaded(self) -> None:
+        """Load the collection if it was never loaded or the ttl expired.
+
+        Only the first load waits for the lock; on reload the thread taking
+        the lock reads the collection and the others return at once.
+        """
+        if not self._expired():
+            return
+        if self.generation == 0:
+            with self._lock:
+                if self._expired():
+                    self.refresh()
+            return
+        # 已有資料: 由取得鎖的執行緒重新載入, 其他執行緒沿用舊資料
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._expired():
+                self.refresh()
+        finally:
+            self._lock.release()
+
+    def refresh(self) -> None:
+        """Load the collection now.
+
+        When the data was loaded before, a failed reload keeps the old data
+        and tries again after another ttl.
+        """
+        try:
+            documents = list(self.collection.find({}))
+        except Exception:
+            if self.generation == 0:
+                raise
+            logger.exception("Reload %s failed, keep old data",
+                             self.__class__.__name__)
+            self._loaded_at = time.monotonic()
+            return
+        self.build(documents)
+        self.generation += 1
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Load the collection again on next use."""
+        self._loaded_at = None
+
+
+class RangeIndex():
+    """
+    class:
+        RangeIndex -- Rows looked up by a numeric range, e.g. lower_age ~ upper_age
+
+        Rows are sorted once by the lower bound, nearest first, so a lookup is
+        a binary search. A row without the upper bound field has no upper bound.
+
+        method:
+            at_most(value: float) -> List[Dict]:
+                Rows whose lower bound is at most the value.
+
+            containing(value: float) -> List[Dict]:
+                Rows whose range contains the value.
+    """
+
+    def __init__(self, rows: Iterable[Dict], lower: Text, upper: Text = None, then: Text = None):
+        """
+        Args:
+            rows (Iterable[Dict]): rows to index
+            lower (Text): field of the lower bound
+            upper (Text, optional): field of the upper bound. Defaults to None.
+            then (Text, optional): field ordering rows of the same lower bound, largest first. Defaults to None.
+        """
+        # 由大到小排序, 相同值保留原本順序
+        if then is None:
+            rows = sorted(rows, key=lambda row: row[lower], reverse=True)
+        else:
+            rows = sorted(rows, key=lambda row: (
+                row[lower], row[then]), reverse=True)
+        self.upper = upper
+        self._rows = rows
+        self._keys = [-row[lower] for row in rows]
+
+    def at_most(self, value: float) -> List[Dict]:
+        """Rows whose lower bound is at most the value.
+
+        Args:
+            value (float): value to look up
+
+        Returns:
+            List[Dict]: rows, largest lower bound first
+        """
+        return self._rows[bisect.bisect_left(self._keys, -value):]
+
+    def containing(self, value: float) -> List[Dict]:
+        """Rows whose range contains the value.
+
+        Args:
+            value (float): value to look up
+
+        Returns:
+            List[Dict]: rows, largest lower bound first
+        """
+        return [row for row in self.at_most(value)
+                if self.upper not in row or row[self.upper] >= value]
+
+
+class QuestionBank(ReferenceCache):
+    """
+    class:
+        QuestionBank -- Cache of `qusetion-database`
+
+        The returned documents are shared, do not modify them.
+
+        method:
+            get(question_group: Text, question_number: Text) -> Dict:
+                Get question by group and question number.
+
+            get_many(question_group: Text, question_numbers: Iterable[Text]) -> Dict[Text, Dict]:
+                Get several questions of one group at once.
+
+            get_by_field(question_group: Text, field_name: Text) -> Dict:
+                Get question by group and field name.
+    """
+
+    def build(self, documents: List[Dict]) -> None:
+        by_number = {}
+        by_field = {}
+        for document in documents:
+            group = document.get("question_group")
+            by_number[(group, str(document.get("question_number")))] = document
+            if "field_name" in document:
+                by_field[(group, document["field_name"])] = document
+        self._by_number = by_number
+        self._by_field = by_field
+
+    def get(self, question_group: Text, question_number: Text) -> Optional[Dict]:
+        """Get question by group and question number.
+
+        Args:
+            question_group (Text): question group, e.g. Suitability_analysis
+            question_number (Text): question number
+
+        Returns:
+            Dict: question document, None if not found
+        """
+        self.ensure_loaded()
+        return self._by_number.get((question_group, str(question_number)))
+
+    def get_many(self, question_group: Text, question_numbers: Iterable[Text]) -> Dict[Text, Dict]:
+        """Get several questions of one group at once.
+
+        Like `get`, only the loaded tables are read; a question added after
+        the last load is found once the bank reloads, call `invalidate` to
+        reload it sooner.
+
+        Args:
+            question_group (Text): question group, e.g. Suitability_analysis
+            question_numbers (Iterable[Text]): question numbers
+
+        Returns:
+            Dict[Text, Dict]: question number -> question document, unknown numbers are left out
+        """
+        self.ensure_loaded()
+        by_number = self._by_number
+        result = {}
+        for question_number in question_numbers:
+            question_number = str(question_number)
+            question = by_number.get((question_group, question_number))
+            if question is not None:
+                result[question_number] = question
+        return result
+
+    def get_by_field(self, question_group: Text, field_name: Text) -> Optional[Dict]:
+        """Get question by group and field name.
+
+        Args:
+            question_group (Text): question group, e.g. joint_financial_planning
+            field_name (Text): field name of the question
+
+        Returns:
+            Dict: question document, None if not found
+        """
+        self.ensure_loaded()
+        return self._by_field.get((question_group, field_name))
+
+
+class QuestionMessageCache():
+    """
+    class:
+        QuestionMessageCache -- Rendered question messages of a question bank
+
+        A question message depends only on the question document, so it is
+        rendered once per (question group, question number) and shared by
+        every user. All messages are dropped when the question bank reloads.
+        The returned messages are shared, do not modify them.
+
+        method:
+            get(question_group: Text, question_number: Text, render: Callable[[Dict], Any]) -> Any:
+                Get the rendered message of a question.
+
+            clear() -> None:
+                Drop all rendered messages.
+    """
+
+    def __init__(self, bank: QuestionBank):
+        """
+        Args:
+            bank (QuestionBank): question bank the messages are rendered from
+        """
+        self.bank = bank
+        self._generation = None
+        self._messages = {}
+
+    @timed("render")
+    def get(self, question_group: Text, question_number: Text, render: Callable[[Dict], Any]) -> Any:
+        """Get the rendered message of a question.
+
+        Args:
+            question_group (Text): question group, e.g. Suitability_analysis
+            question_number (Text): question number
+            render (Callable[[Dict], Any]): renders the message from the question document
+
+        Returns:
+            Any: rendered message
+        """
+        self.bank.ensure_loaded()
+        if self._generation != self.bank.generation:
+            # 題庫已重新載入, 捨棄舊的訊息
+            self._messages = {}
+            self._generation = self.bank.generation
+        messages = self._messages
+        key = (question_group, str(question_number))
+        message = messages.get(key)
+        if message is None:
+            message = render(self.bank.get(question_group, question_number))
+            messages[key] = message
+        return message
+
+    def clear(self) -> None:
+        """Drop all rendered messages."""
+        self._messages = {}
+
+
+class CarInsuranceRules(ReferenceCache):
+    """
+    class:
+        CarInsuranceRules -- Cache of `car_insurance_type`
+
+        Each rule recommends car insurance when every option counter reaches
+        its threshold; among the matching rules the highest priority wins.
+        Rules are kept in priority order, and a rule whose thresholds are all
+        at least those of a higher priority rule is dropped, because that
+        rule always matches first. Results are remembered per counter values.
+        The returned documents are shared, do not modify them.
+
+        method:
+            recommend(option_count: Dict[Text, int]) -> Dict:
+                Get the rule of the highest priority matching the counters.
+    """
+
+    # 計數門檻欄位
+    OPTIONS = ("A", "B", "C", "D", "E")
+
+    def build(self, documents: List[Dict]) -> None:
+        rules = []
+        # priority 以資料庫儲存的字串比較, 與原本 find() 後排序的結果相同
+        for document in sorted(documents, key=lambda document: document["priority"], reverse=True):
+            thresholds = tuple(int(document[option + "_count"])
+                               for option in self.OPTIONS)
+            if any(all(threshold >= dominant for threshold, dominant in zip(thresholds, rule[0]))
+                   for rule in rules):
+                continue
+            rules.append((thresholds, document))
+        self._rules = rules
+        self._results = {}
+
+    def recommend(self, option_count: Dict[Text, int]) -> Optional[Dict]:
+        """Get the rule of the highest priority matching the counters.
+
+        Args:
+            option_count (Dict[Text, int]): option -> number of answers, e.g. {"A": 7, "C": 3}
+
+        Returns:
+            Dict: car insurance rule, None if no rule matches
+        """
+        self.ensure_loaded()
+        counts = tuple(option_count.get(option, 0)
+                       for option in self.OPTIONS)
+        results = self._results
+        if counts not in results:
+            results[counts] = next((document for thresholds, document in self._rules
+                                    if all(count >= threshold for count, threshold in zip(counts, thresholds))), None)
+        return results[counts]
+
+
+class IndexedCollection(ReferenceCache):
+    """
+    class:
+        IndexedCollection -- Cache of a collection looked up by equal fields
+
+        A dict index is built for every field combination given. Like
+        `find_one`, the first document in natural order is returned when
+        several match. Other field combinations scan the copy.
+        The returned documents are shared, do not modify them.
+
+        method:
+            find_one(query: Dict) -> Dict:
+                Get the first document whose fields equal the query.
+    """
+
+    def __init__(self, collection, indexes: Iterable[Iterable[Text]] = (), ttl: float = 300):
+        """
+        Args:
+            collection (Collection): collection to copy
+            indexes (Iterable[Iterable[Text]], optional): field combinations to index. Defaults to ().
+            ttl (float, optional): seconds before the data is loaded again, 0 means never. Defaults to 300.
+        """
+        super().__init__(collection, ttl=ttl)
+        self.indexes = [tuple(sorted(fields)) for fields in indexes]
+
+    def build(self, documents: List[Dict]) -> None:
+        indexes = {}
+        for fields in self.indexes:
+            index = {}
+            for document in documents:
+                if all(field in document for field in fields):
+                    index.setdefault(
+                        tuple(document[field] for field in fields), document)
+            indexes[fields] = index
+        self._documents = documents
+        self._indexes = indexes
+
+    def find_one(self, query: Dict) -> Optional[Dict]:
+        """Get the first document whose fields equal the query.
+
+        Args:
+            query (Dict): field -> value, e.g. {"type_name": "退休", "button_insurance": "1"}
+
+        Returns:
+            Dict: document, None if not found
+        """
+        self.ensure_loaded()
+        fields = tuple(sorted(query))
+        index = self._indexes.get(fields)
+        if index is not None:
+            return index.get(tuple(query[field] for field in fields))
+        return next((document for document in self._documents
+                     if all(field in document and document[field] == value for field, value in query.items())), None)
+
+
+class InsuranceAdvice(IndexedCollection):
+    """
+    class:
+        InsuranceAdvice -- Cache of `insurance-advice`
+
+        Equal field lookups of `IndexedCollection`, and the age range lookups
+        shared by guarantee gap analysis and joint financial planning.
+        The returned documents are shared, do not modify them.
+
+        method:
+            find_one(query: Dict) -> Dict:
+                Get the first document whose fields equal the query.
+
+            insurance_cost(age: int, guarantee_gap: int) -> Dict:
+                Get the recommended insurance cost of an age and guarantee gap.
+
+            insurance_detail(age: int, married: bool, kids: bool) -> Dict:
+                Get the insurance description of an age and family.
+
+            joint_financial(age: int, gender: Text) -> List[Dict]:
+                Get the insurance recommendations of an age and gender.
+    """
+
+    def build(self, documents: List[Dict]) -> None:
+        super().build(documents)
+        groups = {}
+        for document in documents:
+            groups.setdefault(document.get("insurance_group"), []).append(document)
+        joint_financial = {}
+        for document in groups.get("joint_financial_planning", []):
+            joint_financial.setdefault(document["gender"], []).append(document)
+        self._cost = RangeIndex(groups.get("insurance_type_and_cost", []),
+                                "lower_age", then="lower_guarantee_gap")
+        self._detail = RangeIndex([document for document in groups.get("insurance_detail", []) if "upper_age" in document],
+                                  "lower_age", "upper_age")
+        self._joint_financial = {gender: RangeIndex(rows, "lower_age", "upper_age")
+                                 for gender, rows in joint_financial.items()}
+
+    def insurance_cost(self, age: int, guarantee_gap: int) -> Optional[Dict]:
+        """Get the recommended insurance cost of an age and guarantee gap.
+
+        The row of the largest lower_age, then the largest lower_guarantee_gap,
+        not above the age and guarantee gap.
+
+        Args:
+            age (int): age
+            guarantee_gap (int): guarantee gap in 10 thousand
+
+        Returns:
+            Dict: insurance_type_and_cost row, None if not found
+        """
+        self.ensure_loaded()
+        return next((row for row in self._cost.at_most(age)
+                     if row["lower_guarantee_gap"] <= guarantee_gap), None)
+
+    def insurance_detail(self, age: int, married: bool, kids: bool) -> Optional[Dict]:
+        """Get the insurance description of an age and family.
+
+        Args:
+            age (int): age
+            married (bool): is married
+            kids (bool): has kids
+
+        Returns:
+            Dict: insurance_detail row, the only row of the age or the one of the same family, None if not found
+        """
+        self.ensure_loaded()
+        rows = self._detail.containing(age)
+        if len(rows) == 1:
+            return rows[0]
+        return next((row for row in rows
+                     if row["merry"] == married and row["kid"] == kids), None)
+
+    def joint_financial(self, age: int, gender: Text) -> List[Dict]:
+        """Get the insurance recommendations of an age and gender.
+
+        Args:
+            age (int): age
+            gender (Text): gender of the question, e.g. "1"
+
+        Returns:
+            List[Dict]: joint_financial_planning rows, largest lower_age first
+        """
+        self.ensure_loaded()
+        index = self._joint_financial.get(gender)
+        return index.containing(age) if index is not None else []
+
+
+# 題庫
+question_bank = QuestionBank(
+    dbQuestion, ttl=config.getfloat('cache', 'question_ttl', fallback=300))
+
+# 題目訊息
+question_messages = QuestionMessageCache(question_bank)
+
+# 汽車保險推薦規則
+car_insurance_rules = CarInsuranceRules(
+    dbCar_insurance, ttl=config.getfloat('cache', 'car_insurance_ttl', fallback=300))
+
+# 保險建議
+insurance_advice = InsuranceAdvice(
+    dbInsurance,
+    indexes=(("type_name", "button_insurance"),
+             ("type_name", "insurance_group"),
+             ("type_name", "insurance_group", "gender"),
+             ("insurance_group", "age")),
+    ttl=config.getfloat('cache', 'insurance_advice_ttl', fallback=300))
+
+# 投資建議
+investment_advice = IndexedCollection(
+    dbAdvice,
+    indexes=(("suitability_analysis_type",),),
+    ttl=config.getfloat('cache', 'investment_advice_ttl', fallback=300))
+
+
+def load_all() -> None:
+    """Load every cache of the process.
+
+    Called by the webhook before handling events, after gunicorn forks the
+    worker, so no event waits for the first load.
+    """
+    for cache in (question_bank, car_insurance_rules, insurance_advice, investment_advice):
+        cache.ensure_loaded()
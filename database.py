@@ -0,0 +1,367 @@
+# -*- coding: utf8 -*-
+""" MongoDB 連線 """
+import configparser
+import copy
+import logging
+import os
+import threading
+from typing import Dict, Optional, Text
+
+import bson
+from pymongo import MongoClient, monitoring
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.results import UpdateResult
+
+from local_store import LocalDatabase
+import metrics
+from request_context import RequestContext, current_context
+from session import SessionStore
+
+
+# config 環境設定解析
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+# 連線池設定
+mongodb_config = {
+    "maxPoolSize": config.getint('mongodb', 'max_pool_size', fallback=20),
+    "minPoolSize": config.getint('mongodb', 'min_pool_size', fallback=0),
+    "maxIdleTimeMS": config.getint('mongodb', 'max_idle_time_ms', fallback=300000),
+    "connectTimeoutMS": config.getint('mongodb', 'connect_timeout_ms', fallback=5000),
+    "serverSelectionTimeoutMS": config.getint('mongodb', 'server_selection_timeout_ms', fallback=5000),
+    "socketTimeoutMS": config.getint('mongodb', 'socket_timeout_ms', fallback=10000),
+    "waitQueueTimeoutMS": config.getint('mongodb', 'wait_queue_timeout_ms', fallback=5000),
+    "readPreference": config.get('mongodb', 'read_preference', fallback="primary"),
+}
+database_name = config.get('mongodb', 'database', fallback="insurance-data")
+
+logger = logging.getLogger(__name__)
+
+# 資料庫後端: mongodb, 或 local (本機記憶體, 由匯出的 JSON 載入)
+storage_backend = os.environ.get("STORAGE_BACKEND") or config.get(
+    'storage', 'backend', fallback="mongodb")
+
+
+# 指令名稱 -> 查詢條件欄位
+_FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+}
+
+
+def query_shape(value):
+    """Shape of a query filter, values replaced by "?".
+
+    Field names and operators are kept, so queries of the same shape give
+    the same result, e.g. {"user_id": "?", "lower_age": {"$lte": "?"}}.
+
+    Args:
+        value: filter, pipeline or a value in them
+
+    Returns:
+        shape of the value
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return [query_shape(item) for item in value]
+    return "?"
+
+
+def _command_filter(command_name: Text, command: Dict):
+    if command_name in _FILTER_FIELDS:
+        return command.get(_FILTER_FIELDS[command_name])
+    # update 與 delete 取第一筆的條件
+    for field in ("updates", "deletes"):
+        if command.get(field):
+            return command[field][0].get("q")
+    return None
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    class:
+        CommandMonitor -- Time, count and size every MongoDB command
+
+        pymongo calls the listener in the thread sending the command, so a
+        command is recorded as the mongodb stage and counted on the request
+        context of the event handled by that thread. A command slower than
+        `slow_ms` is logged with the shape of its filter.
+    """
+
+    def __init__(self, slow_ms: float = 100, measure_bytes: bool = True):
+        """
+        Args:
+            slow_ms (float, optional): log commands taking at least this many milliseconds. Defaults to 100.
+            measure_bytes (bool, optional): count command and reply BSON size, encoded again. Defaults to True.
+        """
+        self.slow_seconds = slow_ms / 1000
+        self.measure_bytes = measure_bytes
+        # (connection_id, request_id) -> (command, 傳送位元組數)
+        self._started = {}
+
+    def started(self, event):
+        size = len(bson.encode(event.command)) if self.measure_bytes else 0
+        self._started[(event.connection_id, event.request_id)] = (event.command, size)
+
+    def succeeded(self, event):
+        self._finish(event, len(bson.encode(event.reply)) if self.measure_bytes else 0)
+
+    def failed(self, event):
+        self._finish(event, 0)
+
+    def _finish(self, event, reply_size: int) -> None:
+        command, size = self._started.pop(
+            (event.connection_id, event.request_id), (None, 0))
+        seconds = event.duration_micros / 1e6
+        metrics.observe_stage("mongodb", seconds)
+        context = current_context()
+        if context is not None:
+            context.commands += 1
+            context.command_bytes += size + reply_size
+            context.command_seconds += seconds
+        if seconds >= self.slow_seconds and command is not None:
+            collection = command.get(event.command_name)
+            if not isinstance(collection, str):
+                collection = command.get("collection", "")
+            logger.warning("Slow MongoDB command %s %s %.1f ms filter=%s",
+                           event.command_name, collection, seconds * 1000,
+                           query_shape(_command_filter(event.command_name, command)))
+
+
+command_monitor = CommandMonitor(
+    slow_ms=config.getfloat('mongodb', 'slow_command_ms', fallback=100),
+    measure_bytes=config.getboolean('mongodb', 'command_bytes', fallback=True))
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """Get the MongoClient shared by the whole process.
+
+    The client is created on first use with `connect=False`, and is created
+    again when the process id changes, so gunicorn workers forked from a
+    `--preload` master never share sockets or monitor threads.
+
+    Returns:
+        MongoClient: shared client
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(config['connect_config']['Mongodb_atlas_URL'],
+                                      connect=False,
+                                      event_listeners=[command_monitor],
+                                      **mongodb_config)
+                _client_pid = pid
+    return _client
+
+
+_local_database = None
+
+
+def get_local_database() -> LocalDatabase:
+    """Get the in-memory database of the local backend.
+
+    Created on first use and seeded from the JSON files of
+    [storage] seed_dirs; the data lives in the current process only.
+
+    Returns:
+        LocalDatabase: local database
+    """
+    global _local_database
+    if _local_database is None:
+        with _client_lock:
+            if _local_database is None:
+                database = LocalDatabase(database_name)
+                seed_dirs = config.get(
+                    'storage', 'seed_dirs', fallback="DB,insurance-data")
+                loaded = database.seed(directory.strip()
+                                       for directory in seed_dirs.split(",") if directory.strip())
+                logger.info("Local database seeded: %s", loaded)
+                _local_database = database
+    return _local_database
+
+
+def get_database() -> Database:
+    """Get the bot database.
+
+    Returns:
+        Database: `insurance-data` database, a `LocalDatabase` with the local backend
+    """
+    if storage_backend == "local":
+        return get_local_database()
+    return get_client()[database_name]
+
+
+def get_collection(name: Text) -> Collection:
+    """Get a collection of the bot database.
+
+    Args:
+        name (Text): collection name
+
+    Returns:
+        Collection: collection on the shared client
+    """
+    return get_database()[name]
+
+
+class LazyCollection():
+    """
+    class:
+        LazyCollection -- Collection handle resolved on every use
+
+        Module level handles can be imported before the process forks; the
+        real collection always comes from the client of the current process.
+    """
+
+    def __init__(self, name: Text):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_collection(self.name), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+def _equality_filter(filter) -> bool:
+    return isinstance(filter, dict) and all(
+        not key.startswith("$") and not isinstance(value, dict) for key, value in filter.items())
+
+
+def _matches(document: Dict, filter: Dict) -> bool:
+    return all(document.get(key) == value for key, value in filter.items())
+
+
+class UserRequestCollection(LazyCollection):
+    """
+    class:
+        UserRequestCollection -- `user-request` handle sharing one read per event
+
+        Inside a request context, `find_one` with an equality filter on the
+        user of the event is answered from the document loaded once for the
+        event, and `update_one` with `$set` keeps that document up to date.
+        Any other call goes to MongoDB unchanged. `find_one` returns a copy,
+        the same snapshot a query would return.
+
+        With a session store the document is kept between events, and `$set`
+        updates are written back by the store.
+
+        method:
+            current(user_id: Text) -> Dict:
+                The user document shared by the current event.
+    """
+
+    def __init__(self, name: Text, sessions: Optional[SessionStore] = None):
+        super().__init__(name)
+        self.sessions = sessions
+
+    def _context(self, filter) -> Optional[RequestContext]:
+        context = current_context()
+        if context is None or not _equality_filter(filter) or filter.get("user_id") != context.user_id:
+            return None
+        return context
+
+    def _read(self, user_id: Text) -> Optional[Dict]:
+        return get_collection(self.name).find_one({"user_id": user_id})
+
+    def _load(self, user_id: Text) -> Optional[Dict]:
+        with metrics.stage_timer("session"):
+            if self.sessions is None:
+                return self._read(user_id)
+            return self.sessions.get(user_id, self._read)
+
+    def _flush(self, filter) -> None:
+        # 直接存取資料庫前, 先寫入暫存的變更
+        if self.sessions is not None and isinstance(filter, dict) and isinstance(filter.get("user_id"), str):
+            self.sessions.flush(filter["user_id"], raise_errors=True)
+
+    def current(self, user_id: Text) -> Optional[Dict]:
+        """The user document shared by the current event.
+
+        The document is updated in place by `update_one`, do not modify it.
+
+        Args:
+            user_id (Text): event.source.user_id
+
+        Returns:
+            Dict: user document, None if the user has none
+        """
+        context = self._context({"user_id": user_id})
+        if context is None:
+            return self._load(user_id)
+        return context.load(self._load)
+
+    def find_one(self, filter=None, *args, **kwargs) -> Optional[Dict]:
+        context = self._context(filter)
+        if context is None or args or kwargs:
+            self._flush(filter)
+            return get_collection(self.name).find_one(filter, *args, **kwargs)
+        document = context.load(self._load)
+        if document is None:
+            return None
+        if not _matches(document, filter):
+            # 使用者可能有多筆資料, 不符合時查詢資料庫
+            self._flush(filter)
+            return get_collection(self.name).find_one(filter)
+        return copy.deepcopy(document)
+
+    def update_one(self, filter, update, upsert=False, *args, **kwargs):
+        set_fields = update.get("$set") if isinstance(update, dict) and list(update) == ["$set"] else None
+        if set_fields is not None and any("." in key for key in set_fields):
+            set_fields = None
+        if (self.sessions is not None and set_fields is not None and not args and not kwargs
+                and _equality_filter(filter) and isinstance(filter.get("user_id"), str)
+                and self.sessions.update(filter["user_id"], filter, set_fields)):
+            # 由暫存寫入資料庫, 尚未確認寫入結果
+            return UpdateResult({"n": 1, "nModified": 1, "ok": 1.0}, acknowledged=False)
+        self._flush(filter)
+        result = get_collection(self.name).update_one(
+            filter, update, upsert, *args, **kwargs)
+        if self.sessions is not None and isinstance(filter, dict) and isinstance(filter.get("user_id"), str):
+            self.sessions.discard(filter["user_id"])
+        context = self._context(filter)
+        if context is None or not context.loaded:
+            return result
+        if set_fields is None:
+            context.discard()
+        elif context.document is not None and _matches(context.document, filter) and result.matched_count == 1:
+            context.document.update(copy.deepcopy(set_fields))
+        elif context.document is None and result.upserted_id is not None:
+            document = dict(filter, _id=result.upserted_id)
+            document.update(copy.deepcopy(set_fields))
+            context.document = document
+        else:
+            context.discard()
+        return result
+
+
+# 使用者問卷進度暫存, 未啟用時每次事件重新讀取
+user_sessions = None
+if config.getboolean('session', 'hot_tier', fallback=False):
+    user_sessions = SessionStore(lambda: get_collection('user-request'),
+                                 max_users=config.getint('session', 'max_users', fallback=1000),
+                                 ttl=config.getfloat('session', 'ttl', fallback=1800),
+                                 durability=config.get('session', 'durability', fallback="step"),
+                                 flush_interval=config.getfloat('session', 'flush_interval', fallback=5))
+
+# 使用者請求
+dbUserRequest = UserRequestCollection('user-request', user_sessions)
+# 題庫
+dbQuestion = LazyCollection('qusetion-database')
+# 投資建議資料庫
+dbAdvice = LazyCollection('investment-advice')
+# 車險種類資料庫
+dbCar_insurance = LazyCollection('car_insurance_type')
+# 保險建議資料庫
+dbInsurance = LazyCollection('insurance-advice')
@@ -0,0 +1,242 @@
+# -*- coding: utf8 -*-
+""" Webhook 背景事件分派 """
+import atexit
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Text
+
+from linebot import WebhookHandler
+from linebot.models import MessageEvent
+
+
+logger = logging.getLogger(__name__)
+
+# 工作執行緒結束訊號
+_STOP = object()
+
+
+def event_shard_key(event) -> Text:
+    """Get the key used to keep one user's events in order.
+
+    Args:
+        event (Event): webhook event
+
+    Returns:
+        Text: user id, group id or room id of the event source
+    """
+    source = getattr(event, "source", None)
+    for field in ("user_id", "group_id", "room_id"):
+        value = getattr(source, field, None)
+        if value:
+            return value
+    return ""
+
+
+def dispatch_event(handler: WebhookHandler, event) -> None:
+    """Call the function registered on the handler for a single event.
+
+    Uses the same lookup order as `WebhookHandler.handle`: event and message
+    type first, then event type, then the default handler.
+
+    Args:
+        handler (WebhookHandler): handler with registered functions
+        event (Event): webhook event
+    """
+    func = None
+    if isinstance(event, MessageEvent):
+        func = handler._handlers.get(
+            event.__class__.__name__ + "_" + event.message.__class__.__name__)
+    if func is None:
+        func = handler._handlers.get(event.__class__.__name__)
+    if func is None:
+        func = handler._default
+    if func is None:
+        logger.info("No handler of %s and no default handler",
+                    event.__class__.__name__)
+        return
+    func(event)
+
+
+class EventDispatcher():
+    """
+    class:
+        EventDispatcher -- Process webhook events on a background worker pool
+
+        Every worker owns a bounded queue. Events are sharded by user id, so
+        the events of one user are always handled by the same worker in the
+        order they arrived.
+
+        method:
+            start() -> None:
+                Start the worker threads.
+
+            submit(events: List[Event]) -> bool:
+                Put the events of one webhook request on the queues.
+                Returns False (nothing is queued) when any queue is full.
+
+            stats() -> Dict:
+                Queue depth and throughput counters.
+
+            shutdown(timeout: float = None) -> None:
+                Stop accepting events and drain the queues.
+    """
+
+    def __init__(self, handler: WebhookHandler, workers: int = 4, queue_size: int = 200,
+                 drain_timeout: float = 10.0, context_factory: Callable[[], Any] = None):
+        """
+        Args:
+            handler (WebhookHandler): handler with registered functions
+            workers (int, optional): number of worker threads. Defaults to 4.
+            queue_size (int, optional): queue size of each worker. Defaults to 200.
+            drain_timeout (float, optional): seconds to wait on shutdown. Defaults to 10.0.
+            context_factory (Callable, optional): context manager entered around every event, e.g. `app.app_context`. Defaults to None.
+        """
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.drain_timeout = drain_timeout
+        self.context_factory = context_factory
+        self._queues = [queue.Queue(maxsize=self.queue_size)
+                        for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._accepting = False
+        self._counters = {
+            "submitted": 0,
+            "rejected": 0,
+            "processed": 0,
+            "failed": 0,
+            "in_flight": 0,
+            "max_depth": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        with self._submit_lock:
+            if self._threads:
+                return
+            self._start_threads()
+        atexit.register(self.shutdown)
+
+    def _start_threads(self) -> None:
+        self._accepting = True
+        for index, event_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._run,
+                                      args=(event_queue,),
+                                      name=f"webhook-worker-{index}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, events: List) -> bool:
+        """Put the events of one webhook request on the worker queues.
+
+        Either all events are queued or none of them, so a rejected request
+        can be retried by LINE without duplicating events.
+
+        Args:
+            events (List[Event]): parsed webhook events
+
+        Returns:
+            bool: all events are queued
+        """
+        shards: Dict[int, List] = {}
+        for event in events:
+            index = zlib.crc32(event_shard_key(
+                event).encode("utf8")) % self.workers
+            shards.setdefault(index, []).append(event)
+
+        with self._submit_lock:
+            # 確認每個佇列都有足夠空間
+            if not self._accepting or any(self._queues[index].qsize() + len(shard_events) > self.queue_size
+                                          for index, shard_events in shards.items()):
+                with self._stats_lock:
+                    self._counters["rejected"] += len(events)
+                logger.warning("Webhook queue full, rejected %d events",
+                               len(events))
+                return False
+            enqueued_at = time.monotonic()
+            for index, shard_events in shards.items():
+                for event in shard_events:
+                    self._queues[index].put_nowait((enqueued_at, event))
+            depth = max(event_queue.qsize() for event_queue in self._queues)
+
+        with self._stats_lock:
+            self._counters["submitted"] += len(events)
+            if depth > self._counters["max_depth"]:
+                self._counters["max_depth"] = depth
+        return True
+
+    def _run(self, event_queue: queue.Queue) -> None:
+        while True:
+            item = event_queue.get()
+            if item is _STOP:
+                event_queue.task_done()
+                return
+            enqueued_at, event = item
+            wait = time.monotonic() - enqueued_at
+            with self._stats_lock:
+                self._counters["in_flight"] += 1
+                self._counters["wait_seconds_total"] += wait
+                if wait > self._counters["wait_seconds_max"]:
+                    self._counters["wait_seconds_max"] = wait
+            failed = False
+            try:
+                if self.context_factory is None:
+                    dispatch_event(self.handler, event)
+                else:
+                    with self.context_factory():
+                        dispatch_event(self.handler, event)
+            except Exception:
+                failed = True
+                logger.exception("Webhook event handling failed")
+            finally:
+                with self._stats_lock:
+                    self._counters["in_flight"] -= 1
+                    self._counters["failed" if failed else "processed"] += 1
+                event_queue.task_done()
+
+    def stats(self) -> Dict:
+        """Queue depth and throughput counters.
+
+        Returns:
+            Dict: counters of the dispatcher
+        """
+        with self._stats_lock:
+            result = dict(self._counters)
+        result["workers"] = self.workers
+        result["queue_size"] = self.queue_size
+        result["queue_depth"] = [event_queue.qsize()
+                                 for event_queue in self._queues]
+        return result
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting events and wait for the queued events to finish.
+
+        Args:
+            timeout (float, optional): seconds to wait. Defaults to `drain_timeout`.
+        """
+        with self._submit_lock:
+            if not self._accepting:
+                return
+            self._accepting = False
+        deadline = time.monotonic() + \
+            (self.drain_timeout if timeout is None else timeout)
+        for event_queue in self._queues:
+            try:
+                event_queue.put(_STOP, timeout=max(
+                    0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        remaining = sum(event_queue.qsize() for event_queue in self._queues)
+        if remaining:
+            logger.warning(
+                "Webhook dispatcher stopped with %d events not handled", remaining)
@@ -0,0 +1,35 @@
+# -*- coding: utf8 -*-
+""" Flex 訊息模板組裝 """
+from typing import Any, Dict, Hashable, Tuple
+
+
+def fill(prototype: Any, slots: Dict[Tuple[Hashable, ...], Any]) -> Any:
+    """Build a node from a template module with some values replaced.
+
+    Only the dicts and lists on the path of a slot are copied, every other
+    node is shared with the prototype. Template modules are therefore never
+    modified, and nodes returned here must not be modified in place either:
+    pass every change as a slot.
+
+    Example:
+        fill(title_module, {("contents", 1, "text"): "保障缺口"})
+
+    Args:
+        prototype (Any): template module, e.g. `base_template`
+        slots (Dict[Tuple[Hashable, ...], Any]): path of keys and list indexes -> new value
+
+    Returns:
+        Any: new node
+    """
+    if not slots:
+        return prototype
+    node = list(prototype) if isinstance(prototype, list) else dict(prototype)
+    nested = {}
+    for path, value in slots.items():
+        if len(path) == 1:
+            node[path[0]] = value
+        else:
+            nested.setdefault(path[0], {})[path[1:]] = value
+    for key, child_slots in nested.items():
+        node[key] = fill(node[key], child_slots)
+    return node
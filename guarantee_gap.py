@@ -1,27 +1,15 @@
 # -*- coding: utf8 -*-
 """ 保障缺口分析 """
-import configparser
-import copy
 from typing import Text, List, Dict
 
-from linebot.models import FlexSendMessage
-from pymongo import MongoClient
-
+from answer_record import add_answer, load_answers
+from catalog import insurance_advice, question_bank, question_messages
+from database import dbUserRequest
+from flex_builder import fill
 from guarantee_gap_template import base_template, title_module, options_module, calculate_result_module, insurance_advice_module, totle_result_module, insurance_description_module, quickreply
-
-
-# config 環境設定解析
-config = configparser.ConfigParser()
-config.read("config.ini")
-
-# mongoDB atlas 連線
-myMongoClient = MongoClient(config['connect_config']['Mongodb_atlas_URL'])
-
-# 保金系資料庫
-myMongoDb2 = myMongoClient["insurance-data"]
-dbUserRequest = myMongoDb2['user-request']
-dbQuestion = myMongoDb2['qusetion-database']
-dbInsuranceAdvice = myMongoDb2['insurance-advice']
+from line_api import RawFlexSendMessage
+from metrics import timed
+import postback
 
 
 class Guarantee_gap():
@@ -30,10 +18,13 @@ class Guarantee_gap():
         Guarantee_gap -- Guarantee gap analysis
 
         method:
-            render_question_template(user_id: Text) -> FlexSendMessage:
+            render_question_template(user_id: Text) -> RawFlexSendMessage:
                 Render question template.
 
-            render_result_template(user_id: Text) -> List[FlexSendMessage]:
+            build_question_template(question: Dict) -> RawFlexSendMessage:
+                Build question template of a question.
+
+            render_result_template(user_id: Text) -> List[RawFlexSendMessage]:
                 Render result template.
 
             record_answer(user_id: Text,
@@ -53,63 +44,73 @@ class Guarantee_gap():
                 When calculate is False, will according user's answer to return the question or analysis result.
 
     Returns:
-        List(FlexSendMessage): Message return to the user
+        List(RawFlexSendMessage): Message return to the user
     """
     @staticmethod
-    def render_question_template(user_id: Text) -> FlexSendMessage:
+    def render_question_template(user_id: Text) -> RawFlexSendMessage:
         """Render question template
 
         Args:
             user_id (Text): event.source.user_id
 
         Returns:
-            FlexSendMessage: Message returned to the user
+            RawFlexSendMessage: Message returned to the user
         """
         question_number = dbUserRequest.find_one(
             {"user_id": user_id, "status": "Guarantee_gap_analysis"})['question_number']
 
-        content = copy.deepcopy(base_template)
-        # 取得問題
-        question = dbQuestion.find_one(
-            {"question_group": "guarantee_gap_analysis", "question_number": question_number})
+        # 取得已製作的問題模板
+        return question_messages.get(
+            "guarantee_gap_analysis", question_number, Guarantee_gap.build_question_template)
+
+    @staticmethod
+    def build_question_template(question: Dict) -> RawFlexSendMessage:
+        """Build question template, shared by every user
+
+        Args:
+            question (Dict): question document
+
+        Returns:
+            RawFlexSendMessage: Message returned to the user
+        """
+        question_number = str(question['question_number'])
         # 製作問題模板
-        content["hero"] = copy.deepcopy(title_module)
-        content['hero']['contents'][1]['text'] = question['description']
         body_content = []
         for ans_num in range(int(question['answer_sum'])):
-            option = copy.deepcopy(options_module)
-            option['action']['label'] = question['answer' + str(ans_num + 1)]
-            option['action']['data'] = str({
-                "group": "Guarantee_gap", "question_number": question_number, "answer_number": str(ans_num + 1)})
-            option['action']['displayText'] = question['answer' +
-                                                       str(ans_num + 1)]
+            option = fill(options_module, {
+                ('action', 'label'): question['answer' + str(ans_num + 1)],
+                ('action', 'data'): postback.encode({
+                    "group": "Guarantee_gap", "question_number": question_number, "answer_number": str(ans_num + 1)}),
+                ('action', 'displayText'): question['answer' + str(ans_num + 1)]})
             body_content.append(option)
-        content['body']['contents'] = body_content
+        content = fill(base_template, {
+            ("hero",): fill(title_module, {('contents', 1, 'text'): question['description']}),
+            ('body', 'contents'): body_content})
 
-        return FlexSendMessage(alt_text='保障缺口計算', contents=content)
+        return RawFlexSendMessage(alt_text='保障缺口計算', contents=content)
 
     @staticmethod
-    def render_result_template(user_id: Text) -> List[FlexSendMessage]:
+    @timed("render")
+    def render_result_template(user_id: Text) -> List[RawFlexSendMessage]:
         """Render result template
 
         Args:
             user_id (Text): event.source.user_id
 
         Returns:
-            [FlexSendMessage]: The message return to user
+            [RawFlexSendMessage]: The message return to user
         """
         ''' ----- 保障缺口 ----- '''
         # 取得答案
-        result = dbUserRequest.find_one({"user_id": user_id, "status": "Guarantee_gap_analysis"})[
-            'answer_record_guarantee_gap']
-        question_and_answer = {qa.split(':')[0]: qa.split(':')[1]
-                               for qa in result.split('-') if qa != ""}
+        question_and_answer = load_answers(dbUserRequest.find_one(
+            {"user_id": user_id, "status": "Guarantee_gap_analysis"})['answer_record_guarantee_gap'])
         question_and_value = {}
 
         # 取得答案值
+        questions = question_bank.get_many(
+            "guarantee_gap_analysis", question_and_answer.keys())
         for question_number, answer_number in question_and_answer.items():
-            raw_data = dbQuestion.find_one(
-                {"question_group": "guarantee_gap_analysis", "question_number": question_number})
+            raw_data = questions[question_number]
             if answer_number != '0' and raw_data['question_type'] == "guarantee_gap_analysis_answer":
                 question_and_value[question_number] = int(
                     raw_data[f"answer{answer_number}_value"])
@@ -134,128 +135,115 @@ class Guarantee_gap():
             guarantee_gap = 0
 
         # 製作模板
-        content = copy.deepcopy(base_template)
-        content["hero"] = copy.deepcopy(title_module)
-        content['hero']['contents'][1]['text'] = "保障缺口"
-
         body_content = []
-        cash_requirement_result = copy.deepcopy(calculate_result_module)
-        cash_requirement_result['contents'][1]['text'] = "現金需求"
-        cash_requirement_result['contents'][2]['text'] = str(cash_requirement)
+        cash_requirement_result = fill(calculate_result_module, {
+            ('contents', 1, 'text'): "現金需求",
+            ('contents', 2, 'text'): str(cash_requirement)})
         body_content.append(cash_requirement_result)
 
-        cost_of_living_result = copy.deepcopy(calculate_result_module)
-        cost_of_living_result['contents'][0]['text'] = "+"
-        cost_of_living_result['contents'][1]['text'] = "生活費用"
-        cost_of_living_result['contents'][2]['text'] = str(cost_of_living)
+        cost_of_living_result = fill(calculate_result_module, {
+            ('contents', 0, 'text'): "+",
+            ('contents', 1, 'text'): "生活費用",
+            ('contents', 2, 'text'): str(cost_of_living)})
         body_content.append(cost_of_living_result)
 
-        ready_result = copy.deepcopy(calculate_result_module)
-        ready_result['contents'][0]['text'] = "-"
-        ready_result['contents'][1]['text'] = "已準備"
-        ready_result['contents'][2]['text'] = str(ready)
+        ready_result = fill(calculate_result_module, {
+            ('contents', 0, 'text'): "-",
+            ('contents', 1, 'text'): "已準備",
+            ('contents', 2, 'text'): str(ready)})
         body_content.append(ready_result)
 
         body_content.append({"type": "separator"})
 
-        guarantee_gap_result = copy.deepcopy(calculate_result_module)
-        guarantee_gap_result['contents'][1]['text'] = "保障缺口"
-        guarantee_gap_result['contents'][2]['text'] = str(guarantee_gap)
+        guarantee_gap_result = fill(calculate_result_module, {
+            ('contents', 1, 'text'): "保障缺口",
+            ('contents', 2, 'text'): str(guarantee_gap)})
         body_content.append(guarantee_gap_result)
 
-        content['body']['contents'] = body_content
+        content = fill(base_template, {
+            ("hero",): fill(title_module, {('contents', 1, 'text'): "保障缺口"}),
+            ('body', 'contents'): body_content})
         ''' ----- 推薦險種 ----- '''
-        raw = dbInsuranceAdvice.find({"insurance_group": "insurance_type_and_cost", "lower_age": {'$lte': question_and_value['18']}, "lower_guarantee_gap": {
-            "$lte": int(guarantee_gap)}}).sort([("lower_age", -1), ("lower_guarantee_gap", -1)]).limit(1)[0]
+        raw = insurance_advice.insurance_cost(
+            question_and_value['18'], int(guarantee_gap))
 
         insurance = {"life_insurance": "壽險", "term_life_insurance": "定期壽險", "medical_insurance": "醫療險", "cancer_insurance": "癌症險",
                      "major_injury_insurance": "重大傷病險", "accident_insurance": "意外險", "disability_insurance": "失能險"}
 
         # 製作模板
-        content_2 = copy.deepcopy(base_template)
-        content_2["hero"] = copy.deepcopy(title_module)
-        content_2['hero']['contents'][1]['text'] = "推薦險種"
         body_content_2 = []
 
-        group_module = copy.deepcopy(insurance_advice_module)
-        group_module['contents'].pop(2)
-        group_module['contents'][0]['flex'] = 1
-        group_module['contents'][0]['text'] = "類型"
-        group_module['contents'][1]['flex'] = 3
-        group_module['contents'][1]['text'] = raw['group']
+        group_module = fill(insurance_advice_module, {
+            ('contents',): [fill(insurance_advice_module['contents'][0], {('flex',): 1, ('text',): "類型"}),
+                            fill(insurance_advice_module['contents'][1], {('flex',): 3, ('text',): raw['group']})]})
         body_content_2.append(group_module)
 
-        age_module = copy.deepcopy(insurance_advice_module)
-        age_module['contents'][0]['text'] = "年齡群組"
-        age_module['contents'][1]['text'] = str(raw['lower_age'])
-        age_module['contents'][2]['text'] = "歲"
+        age_text = str(raw['lower_age'])
+        age_unit = "歲"
         if "upper_age" in raw:
-            age_module['contents'][1]['text'] += " ~ " + str(raw['upper_age'])
+            age_text += " ~ " + str(raw['upper_age'])
         else:
-            age_module['contents'][2]['text'] += "以上"
+            age_unit += "以上"
+        age_module = fill(insurance_advice_module, {
+            ('contents', 0, 'text'): "年齡群組",
+            ('contents', 1, 'text'): age_text,
+            ('contents', 2, 'text'): age_unit})
         body_content_2.append(age_module)
 
-        guarantee_gap_module = copy.deepcopy(insurance_advice_module)
-        guarantee_gap_module['contents'][0]['text'] = "保障缺口"
-        guarantee_gap_module['contents'][1]['text'] = str(
-            raw['lower_guarantee_gap'])
-        guarantee_gap_module['contents'][2]['text'] = "萬"
+        guarantee_gap_text = str(raw['lower_guarantee_gap'])
+        guarantee_gap_unit = "萬"
         if "upper_guarantee_gap" in raw:
-            guarantee_gap_module['contents'][1]['text'] += " ~ " + \
-                str(raw['upper_guarantee_gap'])
+            guarantee_gap_text += " ~ " + str(raw['upper_guarantee_gap'])
         else:
-            guarantee_gap_module['contents'][2]['text'] += "以上"
+            guarantee_gap_unit += "以上"
+        guarantee_gap_module = fill(insurance_advice_module, {
+            ('contents', 0, 'text'): "保障缺口",
+            ('contents', 1, 'text'): guarantee_gap_text,
+            ('contents', 2, 'text'): guarantee_gap_unit})
         body_content_2.append(guarantee_gap_module)
 
         for index, value in raw.items():
             if index in insurance.keys():
-                insurance_item = copy.deepcopy(insurance_advice_module)
-                insurance_item['contents'][0]['text'] = insurance[index]
-                insurance_item['contents'][1]['text'] = str(value)
-                insurance_item['contents'][2]['text'] = "萬"
+                insurance_unit = "萬"
                 if "status" in raw:
-                    insurance_item['contents'][2]['text'] += "以上" if raw['status'] == "up" else "以下"
+                    insurance_unit += "以上" if raw['status'] == "up" else "以下"
+                insurance_item = fill(insurance_advice_module, {
+                    ('contents', 0, 'text'): insurance[index],
+                    ('contents', 1, 'text'): str(value),
+                    ('contents', 2, 'text'): insurance_unit})
                 body_content_2.append(insurance_item)
 
-        content_2['body']['contents'] = body_content_2
+        content_2 = fill(base_template, {
+            ("hero",): fill(title_module, {('contents', 1, 'text'): "推薦險種"}),
+            ('body', 'contents'): body_content_2})
         ''' ----- 保險說明 ----- '''
-        match_data = dbInsuranceAdvice.find(
-            {"insurance_group": "insurance_detail", "lower_age": {"$lte": question_and_value['18']}, "upper_age": {"$gte": question_and_value['18']}})
-        if match_data.count() > 1:
-            for match_row_data in match_data:
-                if match_row_data["merry"] == bool(question_and_value['1'] - 1) and match_row_data["kid"] == bool(question_and_value['3']):
-                    raw = match_row_data
-                    break
-                else:
-                    raw = None
-        elif match_data.count() == 1:
-            raw = match_data[0]
-        else:
-            raw = None
+        raw = insurance_advice.insurance_detail(question_and_value['18'], bool(
+            question_and_value['1'] - 1), bool(question_and_value['3']))
 
         if raw is not None:
-            insurance_content = copy.deepcopy(base_template)
-            insurance_content["hero"] = copy.deepcopy(title_module)
-            insurance_content['hero']['contents'][1]['text'] = "保險說明"
-            
-            insurance_body = copy.deepcopy(totle_result_module)
-            insurance_body[0]["contents"][1]["text"] = raw['type_name']
-            insurance_body[2]["contents"][1]["text"] = raw['description']
-            insurance_body[4]["contents"][1]["text"] = raw['insurance_list'].replace(',', '、')
-            insurance_body[6]["contents"][1]["text"] = f"{raw['cost']} 元"
-
+            instruction_modules = list(totle_result_module[8]["contents"])
             for index, instruction in enumerate([raw['instruction_a'], raw['instruction_b'], raw['instruction_c'], raw['instruction_d'], raw['instruction_e']]):
-                instruction_module = copy.deepcopy(insurance_description_module)
-                instruction_module["contents"][0]["text"] = instruction.split(" ")[0]
-                instruction_module["contents"][1]["text"] = instruction.split(" ")[1]
+                instruction_slots = {
+                    ("contents", 0, "text"): instruction.split(" ")[0],
+                    ("contents", 1, "text"): instruction.split(" ")[1]}
                 if (index % 2) == 1:
-                    instruction_module["backgroundColor"] = "#00000022"
-                insurance_body[8]["contents"].append(instruction_module)
+                    instruction_slots[("backgroundColor",)] = "#00000022"
+                instruction_modules.append(
+                    fill(insurance_description_module, instruction_slots))
+
+            insurance_body = fill(totle_result_module, {
+                (0, "contents", 1, "text"): raw['type_name'],
+                (2, "contents", 1, "text"): raw['description'],
+                (4, "contents", 1, "text"): raw['insurance_list'].replace(',', '、'),
+                (6, "contents", 1, "text"): f"{raw['cost']} 元",
+                (8, "contents"): instruction_modules})
+
+            insurance_content = fill(base_template, {
+                ("hero",): fill(title_module, {('contents', 1, 'text'): "保險說明"}),
+                ('body', 'contents'): insurance_body})
 
-            insurance_content['body']['contents'] = insurance_body
-            
-            return [FlexSendMessage(alt_text='保障缺口計算', contents=content), FlexSendMessage(alt_text="推薦險種", contents=content_2), FlexSendMessage(alt_text="保險說明", contents=insurance_content)]
-        return [FlexSendMessage(alt_text='保障缺口計算', contents=content), FlexSendMessage(alt_text="推薦險種", contents=content_2)]
+            return [RawFlexSendMessage(alt_text='保障缺口計算', contents=content), RawFlexSendMessage(alt_text="推薦險種", contents=content_2), RawFlexSendMessage(alt_text="保險說明", contents=insurance_content)]
+        return [RawFlexSendMessage(alt_text='保障缺口計算', contents=content), RawFlexSendMessage(alt_text="推薦險種", contents=content_2)]
 
     @ staticmethod
     def record_answer(user_id: Text, question_number: Text = None, answer_number: Text = None) -> None:
@@ -269,7 +257,7 @@ class Guarantee_gap():
         # 開始新紀錄
         if question_number is None or answer_number is None:
             dbUserRequest.update_one({"user_id": user_id, "status": "Guarantee_gap_analysis"}, {
-                                     "$set": {"question_number": '1', "answer_record_guarantee_gap": ''}}, upsert=True)
+                                     "$set": {"question_number": '1', "answer_record_guarantee_gap": {}}}, upsert=True)
         else:
             # 取得使用者紀錄
             user_data = dbUserRequest.find_one(
@@ -277,20 +265,26 @@ class Guarantee_gap():
             # 如果正在回答現在的問題
             if user_data['question_number'] == question_number:
                 # 取得現在回答的問題的資料
-                now_question = dbQuestion.find_one(
-                    {"question_group": "guarantee_gap_analysis", "question_number": question_number})
+                now_question = question_bank.get(
+                    "guarantee_gap_analysis", question_number)
+                # 紀錄選取答案
+                answers = add_answer(load_answers(
+                    user_data['answer_record_guarantee_gap']), question_number, str(answer_number))
 
                 if now_question['final_question'] == "1":
                     dbUserRequest.update_one({"user_id": user_id, "status": "Guarantee_gap_analysis"},
-                                             {"$set": {"question_number": "0", "answer_record_guarantee_gap": user_data['answer_record_guarantee_gap'] + f"-{user_data['question_number']}:{answer_number}"}}, upsert=True)
+                                             {"$set": {"question_number": "0", "answer_record_guarantee_gap": answers}}, upsert=True)
                 # 如果正在回答且不是正在回答最後一題 但能跳題且選了能跳的選項
                 elif now_question['can_skip'] and (now_question['skip_answer'] == str(answer_number)):
+                    # 跳過的題目填入預設答案
+                    answers.update(load_answers(
+                        now_question['skip_answer_value']))
                     dbUserRequest.update_one({"user_id": user_id, "status": "Guarantee_gap_analysis"},
-                                             {"$set": {"question_number": str(now_question['skip_to_question']), "answer_record_guarantee_gap": user_data['answer_record_guarantee_gap'] + f"-{user_data['question_number']}:{answer_number}-{now_question['skip_answer_value']}"}}, upsert=True)
+                                             {"$set": {"question_number": str(now_question['skip_to_question']), "answer_record_guarantee_gap": answers}}, upsert=True)
                 # 如果正在回答且不是正在回答最後一題 但不能跳題或選了不能跳的選項
                 else:
                     dbUserRequest.update_one({"user_id": user_id, "status": "Guarantee_gap_analysis"},
-                                             {"$set": {"question_number": str(int(user_data['question_number']) + 1), "answer_record_guarantee_gap": user_data['answer_record_guarantee_gap'] + f"-{user_data['question_number']}:{answer_number}"}}, upsert=True)
+                                             {"$set": {"question_number": str(int(user_data['question_number']) + 1), "answer_record_guarantee_gap": answers}}, upsert=True)
 
     @ staticmethod
     def content(user_id: Text, calculate: bool = True, postback_data: Dict = None):
@@ -299,11 +293,11 @@ class Guarantee_gap():
         Args:
             user_id (Text): event.source.user_id
             calculate (bool, optional): want to calculate guarantee gap? Defaults to True.
-            postback_data (Dict, optional): eval(event.postback.data). Defaults to None.
+            postback_data (Dict, optional): postback.decode(event.postback.data). Defaults to None.
 
         Returns:
             TextSendMessage: The message return to user
-            FlexSendMessage: The message return to user
+            RawFlexSendMessage: The message return to user
         """
         # 如果要計算
         if calculate:
@@ -0,0 +1,372 @@
+# -*- coding: utf8 -*-
+""" 背景工作佇列 """
+import atexit
+import configparser
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional, Text
+
+
+# config 環境設定解析
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+logger = logging.getLogger(__name__)
+
+# 工作狀態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    user_id TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, kind, id);
+"""
+
+
+class JobQueue():
+    """
+    class:
+        JobQueue -- Durable job queue stored in a local SQLite file
+
+        A job is claimed with a lease; a job whose worker died becomes ready
+        again when the lease expires. A failed job is retried with
+        exponential backoff and moved to `dead` after `max_attempts`.
+
+        method:
+            enqueue(kind: Text, payload: Dict, user_id: Text = None, max_attempts: int = None) -> int:
+                Add a job.
+
+            claim(kinds: Iterable[Text] = None) -> Dict:
+                Take the oldest ready job, None if there is none.
+
+            complete(job_id: int) -> None:
+                Mark a job done.
+
+            fail(job_id: int, error: Text) -> Text:
+                Retry a job later or move it to dead.
+
+            get(job_id: int) -> Dict:
+                Get a job.
+
+            latest(user_id: Text, kind: Text) -> Dict:
+                Get the newest job of a user.
+
+            counts() -> Dict[Text, int]:
+                Number of jobs of each status.
+    """
+
+    def __init__(self, path: Text, max_attempts: int = 5, retry_delay: float = 30,
+                 lease: float = 300):
+        """
+        Args:
+            path (Text): SQLite file path
+            max_attempts (int, optional): tries before a job is dead. Defaults to 5.
+            retry_delay (float, optional): seconds before the first retry, doubled on every retry. Defaults to 30.
+            lease (float, optional): seconds a claimed job is reserved for its worker. Defaults to 300.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return connection
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def enqueue(self, kind: Text, payload: Dict, user_id: Text = None, max_attempts: int = None) -> int:
+        """Add a job.
+
+        Args:
+            kind (Text): job kind, selects the worker function
+            payload (Dict): JSON serializable job data
+            user_id (Text, optional): user the job belongs to. Defaults to None.
+            max_attempts (int, optional): tries before the job is dead. Defaults to the queue setting.
+
+        Returns:
+            int: job id
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                "INSERT INTO jobs (kind, user_id, payload, status, max_attempts, run_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, user_id, json.dumps(payload, ensure_ascii=False), QUEUED,
+                 max_attempts or self.max_attempts, now, now, now))
+            return cursor.lastrowid
+        finally:
+            connection.close()
+
+    def claim(self, kinds=None) -> Optional[Dict]:
+        """Take the oldest ready job.
+
+        Args:
+            kinds (Iterable[Text], optional): job kinds to take, all kinds if None. Defaults to None.
+
+        Returns:
+            Dict: claimed job, None if there is none
+        """
+        now = time.time()
+        query = ("SELECT * FROM jobs WHERE ((status = ? AND run_at <= ?) OR (status = ? AND lease_until <= ?))")
+        params = [QUEUED, now, RUNNING, now]
+        if kinds is not None:
+            kinds = list(kinds)
+            query += " AND kind IN ({})".format(",".join("?" * len(kinds)))
+            params += kinds
+        query += " ORDER BY run_at, id LIMIT 1"
+        connection = self._connect()
+        try:
+            # 取得寫入鎖, 多個 worker 不會取得同一個工作
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(query, params).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, now + self.lease, now, row["id"]))
+            connection.execute("COMMIT")
+            job = self._to_dict(row)
+            job["status"] = RUNNING
+            job["attempts"] += 1
+            return job
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def complete(self, job_id: int) -> None:
+        """Mark a job done.
+
+        Args:
+            job_id (int): job id
+        """
+        connection = self._connect()
+        try:
+            connection.execute("UPDATE jobs SET status = ?, lease_until = NULL, last_error = NULL, updated_at = ? WHERE id = ?",
+                               (DONE, time.time(), job_id))
+        finally:
+            connection.close()
+
+    def fail(self, job_id: int, error: Text) -> Text:
+        """Retry a job later or move it to dead.
+
+        Args:
+            job_id (int): job id
+            error (Text): error message
+
+        Returns:
+            Text: new job status
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?",
+                                     (job_id,)).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return DEAD
+            if row["attempts"] >= row["max_attempts"]:
+                status, run_at = DEAD, now
+            else:
+                # 指數退避, 加上隨機延遲避免同時重試
+                delay = self.retry_delay * 2 ** (row["attempts"] - 1)
+                status, run_at = QUEUED, now + delay * random.uniform(1, 1.5)
+            connection.execute(
+                "UPDATE jobs SET status = ?, run_at = ?, lease_until = NULL, last_error = ?, updated_at = ? WHERE id = ?",
+                (status, run_at, error[:2000], now, job_id))
+            connection.execute("COMMIT")
+            return status
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        """Get a job.
+
+        Args:
+            job_id (int): job id
+
+        Returns:
+            Dict: job, None if not found
+        """
+        connection = self._connect()
+        try:
+            return self._to_dict(connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        finally:
+            connection.close()
+
+    def latest(self, user_id: Text, kind: Text) -> Optional[Dict]:
+        """Get the newest job of a user.
+
+        Args:
+            user_id (Text): event.source.user_id
+            kind (Text): job kind
+
+        Returns:
+            Dict: job, None if the user has none
+        """
+        connection = self._connect()
+        try:
+            return self._to_dict(connection.execute(
+                "SELECT * FROM jobs WHERE user_id = ? AND kind = ? ORDER BY id DESC LIMIT 1",
+                (user_id, kind)).fetchone())
+        finally:
+            connection.close()
+
+    def counts(self) -> Dict[Text, int]:
+        """Number of jobs of each status.
+
+        Returns:
+            Dict[Text, int]: status -> number of jobs
+        """
+        connection = self._connect()
+        try:
+            return {row["status"]: row["total"] for row in
+                    connection.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status")}
+        finally:
+            connection.close()
+
+
+class JobWorker():
+    """
+    class:
+        JobWorker -- Run jobs of a queue with registered functions
+
+        method:
+            run_once() -> bool:
+                Run one ready job, False if there was none.
+
+            run_forever() -> None:
+                Run jobs until stopped.
+
+            start() -> None:
+                Run jobs on a background thread.
+
+            stop(timeout: float = None) -> None:
+                Stop after the running job.
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[Text, Callable[[Dict], None]],
+                 poll_interval: float = 1.0, context_factory: Callable = None):
+        """
+        Args:
+            queue (JobQueue): job queue
+            handlers (Dict[Text, Callable[[Dict], None]]): job kind -> function taking the payload
+            poll_interval (float, optional): seconds between polls of an empty queue. Defaults to 1.0.
+            context_factory (Callable, optional): returns a context manager entered around each job, e.g. `app.app_context`. Defaults to None.
+        """
+        self.queue = queue
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self.context_factory = context_factory
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def run_once(self) -> bool:
+        """Run one ready job.
+
+        Returns:
+            bool: False if there was no ready job
+        """
+        job = self.queue.claim(self.handlers.keys())
+        if job is None:
+            return False
+        try:
+            if self.context_factory is None:
+                self.handlers[job["kind"]](job["payload"])
+            else:
+                with self.context_factory():
+                    self.handlers[job["kind"]](job["payload"])
+        except Exception as error:
+            status = self.queue.fail(job["id"], f"{error.__class__.__name__}: {error}")
+            logger.exception("Job %s (%s) failed on attempt %s, now %s",
+                             job["id"], job["kind"], job["attempts"], status)
+        else:
+            self.queue.complete(job["id"])
+        return True
+
+    def run_forever(self) -> None:
+        """Run jobs until stopped."""
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                logger.exception("Job queue %s unavailable", self.queue.path)
+            self._stop.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """Run jobs on a background thread.
+
+        Safe to call many times; call it after the process forks.
+        """
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self.run_forever, name="job-worker", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop after the running job.
+
+        Args:
+            timeout (float, optional): seconds to wait for the thread. Defaults to None.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+# 背景工作佇列
+job_queue = JobQueue(config.get('jobs', 'path', fallback=os.path.join(os.getcwd(), "jobs.sqlite3")),
+                     max_attempts=config.getint('jobs', 'max_attempts', fallback=5),
+                     retry_delay=config.getfloat('jobs', 'retry_delay', fallback=30),
+                     lease=config.getfloat('jobs', 'lease', fallback=300))
@@ -1,18 +1,24 @@
 # -*- coding: utf8 -*-
 """ 退休財務規劃 """
 import configparser
-import copy
 from decimal import Decimal, ROUND_HALF_UP
+import io
 import openpyxl
 import os
 import re
-import shutil
-from typing import Text, List, Dict, Union
+import threading
+from typing import Any, Text, List, Dict, Tuple, Union
 
 from flask_mail import Mail, Message
 from linebot.models import TextSendMessage, FlexSendMessage
-from pymongo import MongoClient
 
+from catalog import insurance_advice, question_bank
+from database import dbUserRequest
+from flex_builder import fill
+from jobs import DEAD, DONE, job_queue
+from metrics import timed
+from projection import project_assets
+import postback
 from joint_financial_planning_template import base_select_module, base_question_module, setting_module, insurance_type_select_base_module, insurance_type_select_option_module, totle_result_module, insurance_description_module, quickreply
 
 
@@ -20,14 +26,65 @@ from joint_financial_planning_template import base_select_module, base_question_
 config = configparser.ConfigParser()
 config.read("config.ini")
 
-# mongoDB atlas 連線
-myMongoClient = MongoClient(config['connect_config']['Mongodb_atlas_URL'])
+# 退休財務規劃結果寄送工作
+REPORT_JOB = "joint_financial_report"
+# 寄信交給背景工作, 關閉時在回覆前寄出
+report_in_queue = config.getboolean('jobs', 'report_in_queue', fallback=True)
 
-# 保金系資料庫
-myMongoDb2 = myMongoClient["insurance-data"]
-dbQuestion = myMongoDb2['qusetion-database']
-dbUserRequest = myMongoDb2['user-request']
-dbInsuranceAdvice = myMongoDb2['insurance-advice']
+
+class ReportTemplate():
+    """
+    class:
+        ReportTemplate -- xlsx template loaded once per process
+
+        Each report writes its cells into the loaded workbook, saves it into
+        memory and puts the original cell values back, so no file is written
+        and a report costs one workbook plus its bytes.
+
+        method:
+            render(values: Dict[Tuple[Text, Text], Any]) -> bytes:
+                Render a report from the template.
+    """
+
+    def __init__(self, path: Text):
+        """
+        Args:
+            path (Text): xlsx template path
+        """
+        self.path = path
+        self._workbook = None
+        self._lock = threading.Lock()
+
+    def render(self, values: Dict[Tuple[Text, Text], Any]) -> bytes:
+        """Render a report from the template.
+
+        Args:
+            values (Dict[Tuple[Text, Text], Any]): (sheet name, cell) -> value
+
+        Returns:
+            bytes: xlsx file content
+        """
+        with self._lock:
+            if self._workbook is None:
+                self._workbook = openpyxl.load_workbook(self.path)
+            workbook = self._workbook
+            originals = {}
+            try:
+                for (sheet, cell), value in values.items():
+                    originals[(sheet, cell)] = workbook[sheet][cell].value
+                    workbook[sheet][cell] = value
+                output = io.BytesIO()
+                workbook.save(output)
+            finally:
+                # 還原樣板
+                for (sheet, cell), value in originals.items():
+                    workbook[sheet][cell] = value
+        return output.getvalue()
+
+
+# 退休財務規劃結果樣板
+report_template = ReportTemplate(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "joint_financial.xlsx"))
 
 
 class Joint_financial():
@@ -39,6 +96,9 @@ class Joint_financial():
             financial_data (Dict):
                 About joint financial data
 
+            report_fields (Tuple[Text]):
+                Fields of the mailed xlsx report
+
         methods:
             render_template(user_id: Text,
                             mode: Text) -> FlexSendMessage
@@ -61,6 +121,13 @@ class Joint_financial():
             calculate_invest_result(user_data: Dict) -> TextSendMessage:
                 Calculate the result about user's investment income after how many years.
 
+            mail_report(payload: Dict,
+                        mail_instance: Mail) -> None:
+                Render the joint financial xlsx and mail it.
+
+            report_status(user_id: Text) -> TextSendMessage:
+                Status of the user's last mailed report.
+
             send_result(user_id: Text,
                         mail_instance: Mail,
                         send_mail: bool,
@@ -137,8 +204,12 @@ class Joint_financial():
             "units": "萬"
         }
     }
+    # 寄送規劃結果所需欄位
+    report_fields = ("ROI", "CPI", "investable_amount", "age", "salary", "income",
+                     "cost", "expenditure", "loan", "PMT", "rate", "email")
 
     @staticmethod
+    @timed("render")
     def render_template(user_id: Text, mode: Text) -> FlexSendMessage:
         """Render question template.
 
@@ -154,29 +225,30 @@ class Joint_financial():
             {"user_id": user_id, "status": "Joint_financial_planning"})
         # 製作模板
         if mode == "select":
-            content = copy.deepcopy(base_select_module)
             body_content = []
             for field, field_data in Joint_financial.financial_data.items():
-                # 問題、單位...
-                option = copy.deepcopy(setting_module)
-                option['contents'][0]['text'] = field_data['name']
-                option['contents'][3]['text'] = field_data['units']
-                option['contents'][5]['action']['data'] = str(
-                    {"group": "Joint_financial", "question_field": field})
                 # 使用者答案
                 if field in user_data.keys() and user_data[field] != "":
                     if field == "gender":
-                        option['contents'][2]['text'] = "男" if user_data[field] == "1" else "女"
+                        answer = "男" if user_data[field] == "1" else "女"
                     else:
-                        option['contents'][2]['text'] = user_data[field]
+                        answer = user_data[field]
                 else:
-                    option['contents'][2]['text'] = " "
+                    answer = " "
+                # 問題、單位...
+                option = fill(setting_module, {
+                    ('contents', 0, 'text'): field_data['name'],
+                    ('contents', 2, 'text'): answer,
+                    ('contents', 3, 'text'): field_data['units'],
+                    ('contents', 5, 'action', 'data'): postback.encode(
+                        {"group": "Joint_financial", "question_field": field})})
                 body_content.append(option)
-            content['body']['contents'] = body_content
+            content = fill(base_select_module, {
+                ('body', 'contents'): body_content})
         elif mode == "question":
-            content = copy.deepcopy(base_question_module)
-            content['hero']['contents'][1]['text'] = dbQuestion.find_one(
-                {"field_name": user_data['question_number'], "question_group": "joint_financial_planning"})['description']
+            content = fill(base_question_module, {
+                ('hero', 'contents', 1, 'text'): question_bank.get_by_field(
+                    "joint_financial_planning", user_data['question_number'])['description']})
 
         return FlexSendMessage(alt_text='退休財務規劃', contents=content)
 
@@ -253,14 +325,14 @@ class Joint_financial():
                     dbUserRequest.update_one({"user_id": user_id, "status": "Joint_financial_planning"},
                                              {"$set": {"question_number": input_complete, user_data['question_number']: str(input_data)}}, upsert=True)
                 elif mode == "question":
-                    now_question = dbQuestion.find_one(
-                        {"field_name": user_data['question_number'], "question_group": "joint_financial_planning"})
+                    now_question = question_bank.get_by_field(
+                        "joint_financial_planning", user_data['question_number'])
                     if now_question['final_question'] == "1":
                         dbUserRequest.update_one({"user_id": user_id, "status": "Joint_financial_planning"},
                                                  {"$set": {"question_number": "0", user_data['question_number']: str(input_data)}}, upsert=True)
                     else:
-                        next_question = dbQuestion.find_one(
-                            {"question_number": str(int(now_question['question_number'])+1), "question_group": "joint_financial_planning"})
+                        next_question = question_bank.get(
+                            "joint_financial_planning", str(int(now_question['question_number'])+1))
                         dbUserRequest.update_one({"user_id": user_id, "status": "Joint_financial_planning"},
                                                  {"$set": {"question_number": next_question['field_name'], user_data['question_number']: str(input_data)}}, upsert=True)
                 return True
@@ -276,26 +348,7 @@ class Joint_financial():
         Returns:
             Decimal: total assets
         """
-        # 通貨膨脹指數 = (1 + <通貨膨脹指數>) ^ <年數>
-        now_cpi = (
-            (Decimal("1") + Decimal(user_data['CPI'])/Decimal("100"))**year)
-        # 去年總資產
-        if year == 0:
-            last_year_asset = Decimal(
-                user_data['investable_amount'])*Decimal("10000")
-        else:
-            last_year_asset = Joint_financial.total_assets(user_data, year-1)
-        # 年收入 = ( <薪資年收入> + <其他年收入> + <去年累績結餘> * <投資年報酬率> )
-        annual_income = (Decimal(user_data['salary'])*Decimal("10000") +
-                         Decimal(user_data['income'])*Decimal("10000") +
-                         (last_year_asset * Decimal(user_data['ROI']) // Decimal("100"))).quantize(Decimal('.00'), ROUND_HALF_UP)
-        # 年費用 = ( <家用年費用> + <其他年費用> ) * <通貨膨脹指數> + <貸款年費用>
-        annual_expenditure = ((Decimal(user_data['cost']) * Decimal("10000") +
-                               Decimal(user_data['expenditure']) * Decimal("10000")) * now_cpi +
-                              Decimal(user_data['loan'])*Decimal("10000")).quantize(Decimal('.00'), ROUND_HALF_UP)
-        # <累績結餘> = <去年累積結餘> + <年收入> - <年費用>
-        now_asset = (last_year_asset + annual_income - annual_expenditure)
-        return now_asset
+        return project_assets(user_data, year)[-1].asset
 
     @staticmethod
     def calculate_result(user_id: Text, years: int = None) -> TextSendMessage:
@@ -346,33 +399,97 @@ class Joint_financial():
         return TextSendMessage(text=f"{user_data['staging']} 年後，您的總投資收入為 {total_income} 萬元")
 
     @staticmethod
+    @timed("render")
     def result_template(match_result):
-        insurance_content = copy.deepcopy(base_question_module)
-        insurance_content['hero']['contents'][1]['text'] = "保險說明"
-
-        insurance_body = copy.deepcopy(totle_result_module)
-        insurance_body["contents"][0]["contents"][1]["text"] = match_result["type_name"]
-        insurance_body["contents"][2]["contents"][1]["text"] = match_result["insurance_list"].replace(
-            ",", "、")
-        insurance_body["contents"][4]["contents"][1]["text"] = match_result["guarantee_direction"]
-        insurance_body["contents"][6]["contents"][1]["text"] = str(
-            match_result["cost"])
         instruction_list = [match_result["instruction_a"], match_result["instruction_b"],
                             match_result["instruction_c"], match_result["instruction_d"]]
         if match_result["instruction_e"] != "":
             instruction_list.append(match_result["instruction_e"])
+        instruction_modules = list(
+            totle_result_module["contents"][8]["contents"])
         for index, instruction in enumerate(instruction_list):
-            instruction_module = copy.deepcopy(insurance_description_module)
-            instruction_module["contents"][0]["text"] = instruction
+            instruction_slots = {("contents", 0, "text"): instruction}
             if (index % 2) == 1:
-                instruction_module["backgroundColor"] = "#00000022"
-            insurance_body["contents"][8]["contents"].append(
-                instruction_module)
-
-        insurance_content['body'] = insurance_body
+                instruction_slots[("backgroundColor",)] = "#00000022"
+            instruction_modules.append(
+                fill(insurance_description_module, instruction_slots))
+
+        insurance_body = fill(totle_result_module, {
+            ("contents", 0, "contents", 1, "text"): match_result["type_name"],
+            ("contents", 2, "contents", 1, "text"): match_result["insurance_list"].replace(
+                ",", "、"),
+            ("contents", 4, "contents", 1, "text"): match_result["guarantee_direction"],
+            ("contents", 6, "contents", 1, "text"): str(match_result["cost"]),
+            ("contents", 8, "contents"): instruction_modules})
+
+        insurance_content = fill(base_question_module, {
+            ('hero', 'contents', 1, 'text'): "保險說明",
+            ('body',): insurance_body})
 
         return FlexSendMessage(alt_text="保險說明", contents=insurance_content)
 
+    @staticmethod
+    @timed("mail", intent="退休財務規劃")
+    def mail_report(payload: Dict, mail_instance: Mail) -> None:
+        """Render the joint financial xlsx and mail it.
+
+        Args:
+            payload (Dict): user's joint financial data, the fields of `report_fields`
+            mail_instance (Mail): `flask_mail.Mail` object
+        """
+        user_data = payload
+        # 編輯檔案
+        xls_col = ['B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O',
+                   'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD', 'AE', 'AF', 'AG', 'AH', 'AI', 'AJ', 'AK']
+        values = {}
+        values[('主資料表', 'B1')] = Decimal(user_data['ROI']) / 100
+        values[('主資料表', 'B2')] = Decimal(user_data['CPI']) / 100
+        values[('主資料表', 'B3')] = Decimal(user_data['investable_amount']) * 10000
+        values[('主資料表', 'B15')] = Decimal(user_data['age'])
+        for index, col in enumerate(xls_col):
+            if (index + int(user_data['age'])) < 65:
+                values[('主資料表', col+'18')] = Decimal(user_data['salary']) * 10000
+            values[('主資料表', col+'19')] = Decimal(user_data['income']) * 10000
+            values[('主資料表', col+'23')] = Decimal(user_data['cost']) * 10000
+            values[('主資料表', col+'24')] = Decimal(user_data['expenditure']) * 10000
+            values[('主資料表', col+'25')] = Decimal(user_data['loan']) * 10000
+
+        values[('工作表', 'B2')] = Decimal(user_data['PMT']) / 12
+        values[('工作表', 'B3')] = Decimal(user_data['rate'])
+        values[('工作表', 'B4')] = Decimal(user_data['age'])
+
+        # 寄信
+        msg = Message(
+            "退休財務規劃", recipients=[user_data['email']], body="財務規劃資料")
+        msg.attach("financial.xlsx",
+                   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                   report_template.render(values))
+        # .xls -> application/vnd.ms-excel
+        # .xlsx -> application/vnd.openxmlformats-officedocument.spreadsheetml.sheet
+
+        mail_instance.send(msg)
+
+    @staticmethod
+    def report_status(user_id: Text) -> TextSendMessage:
+        """Status of the user's last mailed report.
+
+        Args:
+            user_id (Text): event.source.user_id
+
+        Returns:
+            TextSendMessage: the message to user
+        """
+        job = job_queue.latest(user_id, REPORT_JOB)
+        if job is None:
+            return TextSendMessage(text="尚未寄送退休財務規劃結果")
+        if job["status"] == DONE:
+            return TextSendMessage(text=f"規劃結果已寄至 {job['payload']['email']}")
+        if job["status"] == DEAD:
+            return TextSendMessage(text="規劃結果寄送失敗，請確認信箱後重新進行退休財務規劃")
+        if job["attempts"] > 0:
+            return TextSendMessage(text=f"規劃結果寄送中，已嘗試 {job['attempts']} 次")
+        return TextSendMessage(text="規劃結果寄送中")
+
     @classmethod
     def send_result(cls, user_id: Text, mail_instance: Mail, send_mail: bool, select_type_num: int = None) -> List[TextSendMessage]:
         """Send the joint financial data to user's email.
@@ -389,68 +506,24 @@ class Joint_financial():
         user_data = dbUserRequest.find_one(
             {"user_id": user_id, "status": "Joint_financial_planning"})
 
+        message_text = "已寄出規劃結果至您的電子郵件信箱"
         if send_mail:
-            # 複製檔案
-            original_sheet = r'./joint_financial.xlsx'
-            user_sheet = f'{user_id}.xlsx'
-            shutil.copyfile(original_sheet, user_sheet)
-
-            # 編輯檔案
-            xls_col = ['B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O',
-                       'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD', 'AE', 'AF', 'AG', 'AH', 'AI', 'AJ', 'AK']
-            wb = openpyxl.load_workbook(user_sheet)
-            sheet = wb['主資料表']
-            sheet['B1'] = Decimal(user_data['ROI']) / 100
-            sheet['B2'] = Decimal(user_data['CPI']) / 100
-            sheet['B3'] = Decimal(user_data['investable_amount']) * 10000
-            sheet['B15'] = Decimal(user_data['age'])
-            for index, col in enumerate(xls_col):
-                if (index + int(user_data['age'])) < 65:
-                    sheet[col+'18'] = Decimal(user_data['salary']) * 10000
-                sheet[col+'19'] = Decimal(user_data['income']) * 10000
-                sheet[col+'23'] = Decimal(user_data['cost']) * 10000
-                sheet[col+'24'] = Decimal(user_data['expenditure']) * 10000
-                sheet[col+'25'] = Decimal(user_data['loan']) * 10000
-
-            sheet = wb['工作表']
-            sheet['B2'] = Decimal(user_data['PMT']) / 12
-            sheet['B3'] = Decimal(user_data['rate'])
-            sheet['B4'] = Decimal(user_data['age'])
-            wb.save(user_sheet)
-
-            # 寄信
-            msg = Message(
-                "退休財務規劃", recipients=[user_data['email']], body="財務規劃資料")
-
-            with open(user_sheet, "rb") as fp:
-                msg.attach("financial.xlsx",
-                           "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                           fp.read())
-                # .xls -> application/vnd.ms-excel
-                # .xlsx -> application/vnd.openxmlformats-officedocument.spreadsheetml.sheet
-
-            mail_instance.send(msg)
-
-            if os.path.isfile(os.path.join(os.getcwd(), user_sheet)):
-                os.remove(os.path.join(os.getcwd(), user_sheet))
+            payload = {field: user_data[field]
+                       for field in Joint_financial.report_fields}
+            if report_in_queue:
+                # 交給背景工作寄送, 不等待寄信
+                job_queue.enqueue(REPORT_JOB, payload, user_id=user_id)
+                message_text = "規劃結果寄送中，完成後將寄至您的電子郵件信箱，輸入「寄送狀態」可查詢進度"
+            else:
+                Joint_financial.mail_report(payload, mail_instance)
 
         message_list = [TextSendMessage(
-            text="已寄出規劃結果至您的電子郵件信箱"), Joint_financial.calculate_invest_result(user_data)]
+            text=message_text), Joint_financial.calculate_invest_result(user_data)]
 
         ''' 保險推薦 '''
-        match_data = dbInsuranceAdvice.find({"insurance_group": "joint_financial_planning", "lower_age": {
-                                            '$lte': int(user_data['age'])}, "gender": user_data['gender']}).sort([("lower_age", -1)])
-
-        match_list = []
         # 第一次篩選 - 年齡
-        if match_data.count() > 1:
-            for match_row_data in match_data:
-                if "upper_age" in match_row_data.keys() and match_row_data["upper_age"] >= int(user_data['age']):
-                    match_list.append(match_row_data)
-                elif "upper_age" not in match_row_data.keys():
-                    match_list.append(match_row_data)
-        elif match_data.count() == 1:
-            match_list.append(match_data[0])
+        match_list = insurance_advice.joint_financial(
+            int(user_data['age']), user_data['gender'])
 
         # 沒有結果
         if len(match_list) == 0:
@@ -482,20 +555,18 @@ class Joint_financial():
             else:
                 # 提供選項
                 if select_type_num is None:
-                    insurance_type_select_base_module, insurance_type_select_option_module
-                    content = copy.deepcopy(insurance_type_select_base_module)
                     body_content = []
 
                     for index, data in enumerate(match_list_2):
-                        option = copy.deepcopy(
-                            insurance_type_select_option_module)
-                        option["action"]["label"] = data["type_name"]
-                        option["action"]["data"] = str(
-                            {"group": "Joint_financial", "option": str(index)})
-                        option["action"]["displayText"] = data["type_name"]
+                        option = fill(insurance_type_select_option_module, {
+                            ("action", "label"): data["type_name"],
+                            ("action", "data"): postback.encode(
+                                {"group": "Joint_financial", "option": str(index)}),
+                            ("action", "displayText"): data["type_name"]})
                         body_content.append(option)
 
-                    content["body"]["contents"] = body_content
+                    content = fill(insurance_type_select_base_module, {
+                        ("body", "contents"): body_content})
                     message_list.append(FlexSendMessage(
                         alt_text="請選擇您的類別", contents=content))
 
@@ -0,0 +1,315 @@
+# -*- coding: utf8 -*-
+""" LINE 訊息 API 直接傳送 JSON """
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Text, Tuple, Union
+
+import requests
+from linebot import LineBotApi
+from linebot.http_client import HttpClient, RequestsHttpResponse
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from metrics import timed
+from request_context import current_context
+
+
+logger = logging.getLogger(__name__)
+
+# 可重試的回應狀態
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+
+
+def dumps(data: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON.
+
+    Args:
+        data (Any): JSON serializable data
+
+    Returns:
+        bytes: JSON
+    """
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class RawMessage():
+    """
+    class:
+        RawMessage -- Send message kept as serialized JSON
+
+        Serialized once when created, `RawLineBotApi` puts the bytes into the
+        request body as they are. `as_json_dict` keeps it usable with the
+        plain `LineBotApi`.
+
+        method:
+            as_json_bytes() -> bytes:
+                Message JSON.
+
+            as_json_dict() -> Dict:
+                Message as a new dict.
+    """
+
+    def __init__(self, message: Union[Dict, bytes, Text]):
+        """
+        Args:
+            message (Union[Dict, bytes, Text]): message object of the Messaging API, or its JSON
+        """
+        if isinstance(message, dict):
+            message = dumps(message)
+        elif isinstance(message, str):
+            message = message.encode("utf-8")
+        self._json = message
+
+    def as_json_bytes(self) -> bytes:
+        """Message JSON.
+
+        Returns:
+            bytes: JSON
+        """
+        return self._json
+
+    def as_json_dict(self) -> Dict:
+        """Message as a new dict.
+
+        Returns:
+            Dict: message object
+        """
+        return json.loads(self._json)
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self._json.decode("utf-8")[:80])
+
+
+class RawFlexSendMessage(RawMessage):
+    """
+    class:
+        RawFlexSendMessage -- FlexSendMessage without SDK model objects
+
+        Same arguments as `linebot.models.FlexSendMessage`, but `contents` is
+        serialized as given instead of being converted to SDK models first.
+        `contents` is not modified, template modules may be passed directly.
+    """
+
+    def __init__(self, alt_text: Text, contents: Dict, quick_reply: Any = None):
+        """
+        Args:
+            alt_text (Text): alternative text
+            contents (Dict): bubble or carousel container
+            quick_reply (Any, optional): QuickReply or its dict. Defaults to None.
+        """
+        message = {"type": "flex", "altText": alt_text, "contents": contents}
+        if quick_reply is not None:
+            message["quickReply"] = quick_reply.as_json_dict() if hasattr(
+                quick_reply, "as_json_dict") else quick_reply
+        super().__init__(message)
+
+
+def _unsent(error: Exception) -> bool:
+    # 連線建立前失敗, 請求尚未送出
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class PooledHttpClient(HttpClient):
+    """
+    class:
+        PooledHttpClient -- HttpClient sharing keep-alive connections
+
+        One `requests.Session` per process, created on first use so a
+        preloaded gunicorn app does not share sockets across workers.
+        Idempotent calls (GET, PUT, DELETE and POST with X-Line-Retry-Key)
+        are retried on connection errors and 429/5xx with jittered
+        exponential backoff; other POSTs, e.g. reply, are retried only when
+        the connection could not be made, because the request was never sent.
+
+        method:
+            get(url: Text, headers: Dict = None, params: Dict = None, stream: bool = False, timeout = None) -> RequestsHttpResponse:
+                GET request.
+
+            post(url: Text, headers: Dict = None, data = None, timeout = None) -> RequestsHttpResponse:
+                POST request.
+
+            put(url: Text, headers: Dict = None, data = None, timeout = None) -> RequestsHttpResponse:
+                PUT request.
+
+            delete(url: Text, headers: Dict = None, data = None, timeout = None) -> RequestsHttpResponse:
+                DELETE request.
+    """
+
+    def __init__(self, timeout: Union[float, Tuple[float, float]] = HttpClient.DEFAULT_TIMEOUT,
+                 pool_maxsize: int = 10, retries: int = 2, backoff: float = 0.2):
+        """
+        Args:
+            timeout (Union[float, Tuple[float, float]], optional): default (connect, read) timeout. Defaults to HttpClient.DEFAULT_TIMEOUT.
+            pool_maxsize (int, optional): kept connections per host, about the threads sending requests. Defaults to 10.
+            retries (int, optional): retries after the first try. Defaults to 2.
+            backoff (float, optional): seconds before the first retry, doubled on every retry. Defaults to 0.2.
+        """
+        super().__init__(timeout=timeout)
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=2,
+                                          pool_maxsize=self.pool_maxsize, max_retries=0)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _request(self, method: Text, url: Text, idempotent: bool, timeout=None, **kwargs) -> RequestsHttpResponse:
+        if timeout is None:
+            timeout = self.timeout
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(
+                    method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt >= self.retries or not (idempotent or _unsent(error)):
+                    raise
+                logger.warning("%s %s failed: %s, retry", method, url, error)
+            else:
+                if attempt >= self.retries or not idempotent or response.status_code not in RETRY_STATUS:
+                    return RequestsHttpResponse(response)
+                logger.warning("%s %s returned %s, retry",
+                               method, url, response.status_code)
+                response.close()
+            attempt += 1
+            # 隨機延遲, 避免多個 worker 同時重試
+            time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request("GET", url, True, timeout=timeout, headers=headers, params=params, stream=stream)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        idempotent = bool(headers) and 'X-Line-Retry-Key' in headers
+        return self._request("POST", url, idempotent, timeout=timeout, headers=headers, data=data)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request("PUT", url, True, timeout=timeout, headers=headers, data=data)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request("DELETE", url, True, timeout=timeout, headers=headers, data=data)
+
+
+def _message_json(message) -> bytes:
+    if isinstance(message, RawMessage):
+        return message.as_json_bytes()
+    return dumps(message.as_json_dict())
+
+
+class RawLineBotApi(LineBotApi):
+    """
+    class:
+        RawLineBotApi -- LineBotApi sending serialized messages as they are
+
+        Accepts SDK messages and `RawMessage` mixed; the request body is
+        joined from the message JSON without building it again. Inside a
+        request context the reply timeout is cut to the time left before the
+        reply token of the event expires.
+
+        method:
+            reply_timeout() -> Union[float, Tuple[float, float]]:
+                Timeout of a reply sent now.
+
+            reply_message(reply_token: Text, messages, notification_disabled: bool = False, timeout = None) -> None:
+                Call reply message API.
+
+            push_message(to: Text, messages, retry_key: Text = None, notification_disabled: bool = False, timeout = None) -> None:
+                Call push message API.
+    """
+
+    _headers = {"Content-Type": "application/json; charset=UTF-8"}
+
+    def __init__(self, channel_access_token: Text, reply_token_ttl: float = 60,
+                 min_timeout: float = 1.0, **kwargs):
+        """
+        Args:
+            channel_access_token (Text): channel access token
+            reply_token_ttl (float, optional): seconds a reply token is valid after the event. Defaults to 60.
+            min_timeout (float, optional): smallest connect or read timeout of a reply. Defaults to 1.0.
+            **kwargs: arguments of `LineBotApi`, e.g. endpoint, timeout, http_client
+        """
+        super().__init__(channel_access_token, **kwargs)
+        self.reply_token_ttl = reply_token_ttl
+        self.min_timeout = min_timeout
+
+    def reply_timeout(self) -> Union[float, Tuple[float, float], None]:
+        """Timeout of a reply sent now.
+
+        Returns:
+            Union[float, Tuple[float, float], None]: (connect, read) timeout, None for the client default
+        """
+        context = current_context()
+        event_time = getattr(context, "event_time", None)
+        if event_time is None:
+            return None
+        # 回覆權杖過期後送出也會失敗, 不需要等得更久
+        left = max(event_time + self.reply_token_ttl -
+                   time.time(), self.min_timeout)
+        timeout = self.http_client.timeout
+        connect, read = timeout if isinstance(
+            timeout, tuple) else (timeout, timeout)
+        return (min(connect, left), min(read, left))
+
+    @staticmethod
+    def _body(target_key: bytes, target: Text, messages, notification_disabled: bool) -> bytes:
+        if not isinstance(messages, (list, tuple)):
+            messages = [messages]
+        return b"".join((
+            b'{"', target_key, b'":', dumps(target),
+            b',"messages":[', b",".join(_message_json(message) for message in messages),
+            b'],"notificationDisabled":', b"true" if notification_disabled else b"false", b"}"))
+
+    @timed("line_reply")
+    def reply_message(self, reply_token, messages, notification_disabled=False, timeout=None):
+        """Call reply message API.
+
+        Args:
+            reply_token (Text): replyToken received via webhook
+            messages (Union[SendMessage, RawMessage, List]): messages, max 5
+            notification_disabled (bool, optional): disable push notification. Defaults to False.
+            timeout (Union[float, Tuple[float, float]], optional): request timeout. Defaults to `reply_timeout()`.
+        """
+        if timeout is None:
+            timeout = self.reply_timeout()
+        self._post('/v2/bot/message/reply',
+                   data=self._body(b"replyToken", reply_token,
+                                   messages, notification_disabled),
+                   headers=dict(self._headers), timeout=timeout)
+
+    @timed("line_push")
+    def push_message(self, to, messages, retry_key=None, notification_disabled=False, timeout=None):
+        """Call push message API.
+
+        Args:
+            to (Text): user, group or room id
+            messages (Union[SendMessage, RawMessage, List]): messages, max 5
+            retry_key (Text, optional): X-Line-Retry-Key of this request. Defaults to None.
+            notification_disabled (bool, optional): disable push notification. Defaults to False.
+            timeout (Union[float, Tuple[float, float]], optional): request timeout. Defaults to the client timeout.
+        """
+        headers = dict(self._headers)
+        if retry_key:
+            headers['X-Line-Retry-Key'] = retry_key
+        self._post('/v2/bot/message/push',
+                   data=self._body(b"to", to, messages,
+                                   notification_disabled),
+                   headers=headers, timeout=timeout)
@@ -0,0 +1,383 @@
+# -*- coding: utf8 -*-
+""" 本機記憶體資料庫, 取代 MongoDB 供開發與效能測試 """
+import copy
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Text, Tuple, Union
+
+from bson import ObjectId, json_util
+from pymongo import InsertOne, UpdateOne
+from pymongo.results import BulkWriteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _get(document: Dict, key: Text) -> Any:
+    # 支援 "a.b" 形式的欄位
+    value = document
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _type_matches(value: Any, type_name: Union[Text, int]) -> bool:
+    types = {"string": str, 2: str, "object": dict, 3: dict, "array": list, 4: list,
+             "bool": bool, 8: bool, "int": int, 16: int, "double": float, 1: float}
+    return type_name in types and isinstance(value, types[type_name])
+
+
+def _compare(value: Any, operator: Text, operand: Any) -> bool:
+    if operator == "$eq":
+        return value is not _MISSING and value == operand
+    if operator == "$ne":
+        return value is _MISSING or value != operand
+    if operator == "$in":
+        return value is not _MISSING and value in operand
+    if operator == "$nin":
+        return value is _MISSING or value not in operand
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator == "$type":
+        return value is not _MISSING and _type_matches(value, operand)
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+    except TypeError:
+        # 型態不同的值不比較, 與 MongoDB 相同
+        return False
+    raise NotImplementedError(f"Query operator {operator} is not supported")
+
+
+def matches(document: Dict, filter: Optional[Dict]) -> bool:
+    """Whether a document matches a query filter.
+
+    Supports equality, $eq, $ne, $in, $nin, $exists, $type, $lt, $lte, $gt,
+    $gte, $and and $or, the operators the bot uses.
+
+    Args:
+        document (Dict): document
+        filter (Optional[Dict]): query filter
+
+    Returns:
+        bool: document matches
+    """
+    for key, condition in (filter or {}).items():
+        if key == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(operator.startswith("$") for operator in condition):
+            value = _get(document, key)
+            if not all(_compare(value, operator, operand) for operator, operand in condition.items()):
+                return False
+        elif not _compare(_get(document, key), "$eq", condition):
+            return False
+    return True
+
+
+def _project(document: Dict, projection: Optional[Dict]) -> Dict:
+    if not projection:
+        return copy.deepcopy(document)
+    included = [key for key, value in projection.items() if value and key != "_id"]
+    if included:
+        result = {key: copy.deepcopy(document[key])
+                  for key in included if key in document}
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+    return {key: copy.deepcopy(value) for key, value in document.items() if key not in projection}
+
+
+def _sort_key(value: Any) -> Tuple:
+    # 不存在或 null 排在最前面, 與 MongoDB 相同
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, str(value))
+
+
+class LocalCursor():
+    """
+    class:
+        LocalCursor -- Result of `LocalCollection.find`
+
+        Supports the cursor calls the bot uses: iteration, indexing, sort,
+        limit, skip and count.
+    """
+
+    def __init__(self, documents: List[Dict], projection: Optional[Dict] = None):
+        self._documents = documents
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list: Union[Text, List[Tuple[Text, int]]], direction: int = 1) -> "LocalCursor":
+        keys = [(key_or_list, direction)] if isinstance(
+            key_or_list, str) else list(key_or_list)
+        # 由最後一個鍵開始穩定排序
+        for key, key_direction in reversed(keys):
+            self._documents.sort(key=lambda document: _sort_key(_get(document, key)),
+                                 reverse=key_direction < 0)
+        return self
+
+    def limit(self, limit: int) -> "LocalCursor":
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int) -> "LocalCursor":
+        self._skip = skip
+        return self
+
+    def _selected(self) -> List[Dict]:
+        end = self._skip + self._limit if self._limit else None
+        return self._documents[self._skip:end]
+
+    def count(self, with_limit_and_skip: bool = False) -> int:
+        return len(self._selected() if with_limit_and_skip else self._documents)
+
+    def __iter__(self):
+        return (_project(document, self._projection) for document in self._selected())
+
+    def __getitem__(self, index: int) -> Dict:
+        return _project(self._selected()[index], self._projection)
+
+
+class LocalCollection():
+    """
+    class:
+        LocalCollection -- In-memory collection with the pymongo calls the bot uses
+
+        Documents are copied in and out, so callers can not change the stored
+        documents, the same as with MongoDB. Updates support `$set`,
+        `$unset` and `$inc`.
+
+        method:
+            find_one(filter: Dict = None, projection: Dict = None) -> Dict:
+                First matching document.
+
+            find(filter: Dict = None, projection: Dict = None) -> LocalCursor:
+                Matching documents.
+
+            count_documents(filter: Dict) -> int:
+                Number of matching documents.
+
+            insert_one(document: Dict) -> InsertOneResult:
+                Add a document.
+
+            insert_many(documents: Iterable[Dict]) -> InsertManyResult:
+                Add documents.
+
+            update_one(filter: Dict, update: Dict, upsert: bool = False) -> UpdateResult:
+                Update the first matching document.
+
+            update_many(filter: Dict, update: Dict, upsert: bool = False) -> UpdateResult:
+                Update every matching document.
+
+            bulk_write(requests: List, ordered: bool = True) -> BulkWriteResult:
+                Run UpdateOne / InsertOne requests.
+
+            create_indexes(indexes: List) -> List[Text]:
+                Accept index declarations, every query scans the documents.
+    """
+
+    def __init__(self, name: Text, documents: Iterable[Dict] = ()):
+        self.name = name
+        self._documents = [copy.deepcopy(document) for document in documents]
+        self._lock = threading.RLock()
+
+    def find_one(self, filter: Optional[Dict] = None, projection: Optional[Dict] = None, *args, **kwargs) -> Optional[Dict]:
+        with self._lock:
+            for document in self._documents:
+                if matches(document, filter):
+                    return _project(document, projection)
+        return None
+
+    def find(self, filter: Optional[Dict] = None, projection: Optional[Dict] = None, *args, **kwargs) -> LocalCursor:
+        with self._lock:
+            return LocalCursor([document for document in self._documents if matches(document, filter)],
+                               projection)
+
+    def count_documents(self, filter: Dict, *args, **kwargs) -> int:
+        with self._lock:
+            return sum(1 for document in self._documents if matches(document, filter))
+
+    def _insert(self, document: Dict) -> Any:
+        document = copy.deepcopy(document)
+        document.setdefault("_id", ObjectId())
+        self._documents.append(document)
+        return document["_id"]
+
+    def insert_one(self, document: Dict, *args, **kwargs) -> InsertOneResult:
+        with self._lock:
+            return InsertOneResult(self._insert(document), acknowledged=True)
+
+    def insert_many(self, documents: Iterable[Dict], *args, **kwargs) -> InsertManyResult:
+        with self._lock:
+            return InsertManyResult([self._insert(document) for document in documents], acknowledged=True)
+
+    @staticmethod
+    def _apply(document: Dict, update: Dict) -> bool:
+        before = copy.deepcopy(document)
+        for operator, fields in update.items():
+            for key, value in fields.items():
+                *parents, field = key.split(".")
+                target = document
+                for part in parents:
+                    target = target.setdefault(part, {})
+                if operator == "$set":
+                    target[field] = copy.deepcopy(value)
+                elif operator == "$unset":
+                    target.pop(field, None)
+                elif operator == "$inc":
+                    target[field] = target.get(field, 0) + value
+                else:
+                    raise NotImplementedError(
+                        f"Update operator {operator} is not supported")
+        return document != before
+
+    def _upsert_document(self, filter: Dict, update: Dict) -> Dict:
+        # 以篩選條件中的相等欄位建立新資料
+        document = {key: copy.deepcopy(value) for key, value in filter.items()
+                    if not key.startswith("$") and not isinstance(value, dict)}
+        self._apply(document, update)
+        return document
+
+    def _update(self, filter: Dict, update: Dict, upsert: bool, many: bool) -> UpdateResult:
+        matched = modified = 0
+        for document in self._documents:
+            if matches(document, filter):
+                matched += 1
+                modified += self._apply(document, update)
+                if not many:
+                    break
+        raw_result = {"n": matched, "nModified": modified, "ok": 1.0}
+        if matched == 0 and upsert:
+            raw_result["n"] = 1
+            raw_result["upserted"] = self._insert(
+                self._upsert_document(filter, update))
+        return UpdateResult(raw_result, acknowledged=True)
+
+    def update_one(self, filter: Dict, update: Dict, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        with self._lock:
+            return self._update(filter, update, upsert, many=False)
+
+    def update_many(self, filter: Dict, update: Dict, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        with self._lock:
+            return self._update(filter, update, upsert, many=True)
+
+    def bulk_write(self, requests: List, ordered: bool = True, *args, **kwargs) -> BulkWriteResult:
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0,
+                  "nRemoved": 0, "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        with self._lock:
+            for index, request in enumerate(requests):
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                    continue
+                if not isinstance(request, UpdateOne):
+                    raise NotImplementedError(
+                        f"Bulk request {request!r} is not supported")
+                update = self._update(request._filter, request._doc,
+                                      request._upsert, many=False)
+                result["nMatched"] += update.matched_count - (1 if update.upserted_id is not None else 0)
+                result["nModified"] += update.modified_count
+                if update.upserted_id is not None:
+                    result["nUpserted"] += 1
+                    result["upserted"].append({"index": index, "_id": update.upserted_id})
+        return BulkWriteResult(result, acknowledged=True)
+
+    def create_indexes(self, indexes: List, *args, **kwargs) -> List[Text]:
+        return [index.document["name"] for index in indexes]
+
+
+class LocalDatabase():
+    """
+    class:
+        LocalDatabase -- In-memory database of `LocalCollection`
+
+        A collection is created on first use. The data lives in this process
+        only; run a single worker process.
+
+        method:
+            seed(directories: Iterable[Text]) -> Dict[Text, int]:
+                Load collections from exported JSON files.
+    """
+
+    def __init__(self, name: Text = "local"):
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: Text) -> LocalCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.setdefault(
+                    name, LocalCollection(name))
+        return collection
+
+    def list_collection_names(self) -> List[Text]:
+        return list(self._collections)
+
+    def seed(self, directories: Iterable[Text]) -> Dict[Text, int]:
+        """Load collections from exported JSON files.
+
+        Every `<collection>.json` is read, a JSON array or one document per
+        line (mongoexport); a collection found in several directories is
+        taken from the first one.
+
+        Args:
+            directories (Iterable[Text]): directories of the JSON files, e.g. ["DB", "insurance-data"]
+
+        Returns:
+            Dict[Text, int]: collection -> number of loaded documents
+        """
+        loaded = {}
+        for directory in directories:
+            if not os.path.isdir(directory):
+                logger.warning("Seed directory %s not found", directory)
+                continue
+            for file_name in sorted(os.listdir(directory)):
+                name, extension = os.path.splitext(file_name)
+                if extension != ".json" or name in loaded:
+                    continue
+                documents = load_json(os.path.join(directory, file_name))
+                with self._lock:
+                    self._collections[name] = LocalCollection(name, documents)
+                loaded[name] = len(documents)
+        return loaded
+
+
+def load_json(path: Text) -> List[Dict]:
+    """Read documents exported from MongoDB.
+
+    Args:
+        path (Text): JSON array file, or one document per line
+
+    Returns:
+        List[Dict]: documents, extended JSON such as {"$oid": ...} converted
+    """
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+    if text.lstrip().startswith("["):
+        return json_util.loads(text)
+    return [json_util.loads(line) for line in text.splitlines() if line.strip()]
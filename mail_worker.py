@@ -0,0 +1,44 @@
+# -*- coding: utf8 -*-
+""" 退休財務規劃結果寄送工作
+
+在 web 行程以外寄信時執行:
+    python mail_worker.py
+並在 config.ini 設定 [jobs] in_process_worker=false
+"""
+import configparser
+import logging
+
+import flask_mail
+from flask import Flask
+
+from jobs import JobWorker, job_queue
+from joint_financial_planning import REPORT_JOB, Joint_financial
+
+
+# config 環境設定解析
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+app = Flask(__name__)
+app.config['MAIL_SERVER'] = 'smtp.gmail.com'
+app.config['MAIL_PORT'] = 587
+app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_USERNAME'] = config['flask_mail']['MAIL_USERNAME']
+app.config['MAIL_PASSWORD'] = config['flask_mail']['MAIL_PASSWORD']
+app.config['MAIL_DEFAULT_SENDER'] = config['flask_mail']['MAIL_USERNAME'] + "@gmail.com"
+app.config['MAIL_ASCII_ATTACHMENTS'] = False
+mail_object = flask_mail.Mail(app)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    worker = JobWorker(job_queue,
+                       {REPORT_JOB: lambda payload: Joint_financial.mail_report(
+                           payload, mail_object)},
+                       poll_interval=config.getfloat(
+                           'jobs', 'poll_interval', fallback=1.0),
+                       context_factory=app.app_context)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,21 +1,13 @@
 # -*- coding: utf8 -*-
-import configparser
 from abc import ABC, abstractmethod
 from linebot.models import FlexSendMessage, ImageSendMessage
-from pymongo import MongoClient
 
-# config 環境設定解析
-config = configparser.ConfigParser()
-config.read("config.ini")
+from answer_record import answer_text, load_answers, options_text
+from catalog import insurance_advice, question_bank, question_messages
+from database import dbUserRequest
+from line_api import RawFlexSendMessage
+from metrics import timed
 
-# mongoDB atlas 連線
-myMongoClient = MongoClient(config['connect_config']['Mongodb_atlas_URL'])
-
-# 保金系資料庫
-myMongoDb2 = myMongoClient["insurance-data"]
-dbUserRequest = myMongoDb2['user-request']
-dbQuestion = myMongoDb2['qusetion-database']
-dbInsurance = myMongoDb2['insurance-advice']
 # 訊息抽象類別
 
 
@@ -35,14 +27,16 @@ class Suitability_analysis():
         self.user_id = user_id
 
     def content(self):
-        def func_answer_append(user_id):
-            # 獲取進行分析的使用者資料
-            check_data = {"user_id": user_id}
-            user_data = dbUserRequest.find_one(check_data)
-            # 獲取當前題目
-            check_data = {
-                "question_number": user_data["question_number"], "question_group": "Suitability_analysis"}
-            qusetion = dbQuestion.find_one(check_data)
+        # 獲取進行分析的使用者資料
+        check_data = {"user_id": self.user_id}
+        user_data = dbUserRequest.find_one(check_data)
+        # 題目訊息只與題目有關, 取得已製作的訊息
+        return question_messages.get(
+            "Suitability_analysis", user_data["question_number"], Suitability_analysis.render)
+
+    @staticmethod
+    def render(qusetion):
+        def func_answer_append(qusetion):
             # 初始化答案清單, 答案回傳清單
             answer_list = []
             answer_return_list = []
@@ -61,7 +55,7 @@ class Suitability_analysis():
                     answer_list.append(qusetion["answer5"])
                 # 設定按鈕回傳文字
                 answer_text = "ans:" + \
-                    str(user_data["question_number"]) + \
+                    str(qusetion["question_number"]) + \
                     "-" + str(answer_conut + 1)
                 # 答案回傳清單添加回傳文字
                 answer_return_list.append(answer_text)
@@ -71,14 +65,14 @@ class Suitability_analysis():
                 check_button = "[確定]"
                 answer_list.append(check_button)
                 answer_return_list.append(
-                    "ans:" + str(user_data["question_number"]) + "-" + check_button)
+                    "ans:" + str(qusetion["question_number"]) + "-" + check_button)
             # 回傳題目字串, 答案清單, 答案回傳清單
             return qusetion["description"], answer_list, answer_return_list
         # 初始化按鈕清單
         data_list = []
         # 進入函式處理資料, 取得題目字串, 答案清單, 答案回傳清單
         description, answer_list, answer_return_list = func_answer_append(
-            self.user_id)
+            qusetion)
         # 迴圈添加答案進入按鈕清單
         for label_text, return_text in zip(answer_list, answer_return_list):
             data_bubble = {
@@ -93,7 +87,7 @@ class Suitability_analysis():
                 "adjustMode": "shrink-to-fit"
             }
             data_list.append(data_bubble)
-        flex_message = FlexSendMessage(
+        flex_message = RawFlexSendMessage(
             alt_text='適合性分析',
             contents={
                 "type": "bubble",
@@ -151,14 +145,16 @@ class Car_insurance_planning():
         self.user_id = user_id
 
     def content(self):
-        def func_answer_append(user_id):
-            # 獲取進行規劃的使用者資料
-            check_data = {"user_id": user_id}
-            user_data = dbUserRequest.find_one(check_data)
-            # 獲取當前題目
-            check_data = {
-                "question_number": user_data["question_number"], "question_group": "Car_insurance_planning"}
-            qusetion = dbQuestion.find_one(check_data)
+        # 獲取進行規劃的使用者資料
+        check_data = {"user_id": self.user_id}
+        user_data = dbUserRequest.find_one(check_data)
+        # 題目訊息只與題目有關, 取得已製作的訊息
+        return question_messages.get(
+            "Car_insurance_planning", user_data["question_number"], Car_insurance_planning.render)
+
+    @staticmethod
+    def render(qusetion):
+        def func_answer_append(qusetion):
             # 初始化答案清單, 答案回傳清單
             answer_list = []
             answer_return_list = []
@@ -183,7 +179,7 @@ class Car_insurance_planning():
                     letter = "E"
                 # 設定按鈕回傳文字
                 answer_text = "ans:" + \
-                    str(user_data["question_number"]) + "-" + letter
+                    str(qusetion["question_number"]) + "-" + letter
                 # 答案回傳清單添加回傳文字
                 answer_return_list.append(answer_text)
             # 回傳題目字串, 答案清單, 答案回傳清單
@@ -192,7 +188,7 @@ class Car_insurance_planning():
         data_list = []
         # 進入函式處理資料, 取得題目字串, 答案清單, 答案回傳清單
         description, answer_list, answer_return_list = func_answer_append(
-            self.user_id)
+            qusetion)
         # 迴圈添加答案進入按鈕清單
         for label_text, return_text in zip(answer_list, answer_return_list):
             data_bubble = {
@@ -207,7 +203,7 @@ class Car_insurance_planning():
                 "adjustMode": "shrink-to-fit"
             }
             data_list.append(data_bubble)
-        flex_message = FlexSendMessage(
+        flex_message = RawFlexSendMessage(
             alt_text='汽車保險規劃',
             contents={
                 "type": "bubble",
@@ -264,6 +260,7 @@ class Result_template():
     def __init__(self, myReply):
         self.myReply = myReply
 
+    @timed("render")
     def content(self, title, image_url):
         # 分割字串成列表
         reply_list = self.myReply.split("\n")
@@ -410,14 +407,16 @@ class Life_stage1():
         self.user_id = user_id
 
     def content(self):
-        def func_answer_append(user_id):
-            # 獲取進行規劃的使用者資料
-            check_data = {"user_id": user_id}
-            user_data = dbUserRequest.find_one(check_data)
-            # 獲取當前題目
-            check_data = {
-                "question_number": user_data["question_number"], "question_group": "Life_stage1"}
-            qusetion = dbQuestion.find_one(check_data)
+        # 獲取進行規劃的使用者資料
+        check_data = {"user_id": self.user_id}
+        user_data = dbUserRequest.find_one(check_data)
+        # 題目訊息只與題目有關, 取得已製作的訊息
+        return question_messages.get(
+            "Life_stage1", user_data["question_number"], Life_stage1.render)
+
+    @staticmethod
+    def render(qusetion):
+        def func_answer_append(qusetion):
             # 初始化答案清單, 答案回傳清單
             answer_list = []
             answer_return_list = []
@@ -438,7 +437,7 @@ class Life_stage1():
                     answer_list.append(qusetion["answer6"])
                 # 設定按鈕回傳文字
                 answer_text = "ans:" + \
-                    str(user_data["question_number"]) + \
+                    str(qusetion["question_number"]) + \
                     "-" + str(answer_conut + 1)
                 # 答案回傳清單添加回傳文字
                 answer_return_list.append(answer_text)
@@ -448,14 +447,14 @@ class Life_stage1():
                 check_button = "[確定]"
                 answer_list.append(check_button)
                 answer_return_list.append(
-                    "ans:" + str(user_data["question_number"]) + "-" + check_button)
+                    "ans:" + str(qusetion["question_number"]) + "-" + check_button)
             # 回傳題目字串, 答案清單, 答案回傳清單
             return qusetion["description"], answer_list, answer_return_list
         # 初始化按鈕清單
         data_list = []
         # 進入函式處理資料, 取得題目字串, 答案清單, 答案回傳清單
         description, answer_list, answer_return_list = func_answer_append(
-            self.user_id)
+            qusetion)
         # 迴圈添加答案進入按鈕清單
         for label_text, return_text in zip(answer_list, answer_return_list):
             data_bubble = {
@@ -470,7 +469,7 @@ class Life_stage1():
                 "adjustMode": "shrink-to-fit"
             }
             data_list.append(data_bubble)
-        flex_message = FlexSendMessage(
+        flex_message = RawFlexSendMessage(
             alt_text='人生保險規劃',
             contents={
                 "type": "bubble",
@@ -524,53 +523,45 @@ class Life_stage1():
 class Life_stage1_result():
     @ staticmethod
     def record(check_data, event):
-        user_data = dbUserRequest.find(check_data)
-        if user_data.count() != 0:
+        user_data = dbUserRequest.find_one(check_data)
+        if user_data is not None:
             # 回傳分析結果
-            answer_record_life_stage_list = user_data[0]["answer_record_life_stage"].split(
-                "-")
+            answers = load_answers(
+                user_data["answer_record_life_stage"], "Life_stage1")
             # 獲取投資類型對應的投資建議
             check_data = {
-                "life_stage1_type": user_data[0]["life_stage1_type"]}
+                "life_stage1_type": user_data["life_stage1_type"]}
             # 回傳資料格式
             # myReply = "上次人生保險規劃結果：\n"
             myReply = "人生階段：" + \
-                user_data[0]["life_stage1_type"] + "\n"
-            myReply += "加總分數：" + user_data[0]["score"] + "\n"
+                user_data["life_stage1_type"] + "\n"
+            myReply += "加總分數：" + user_data["score"] + "\n"
             myReply += "選項紀錄：" + "\n"
-            for i in range(len(answer_record_life_stage_list)):
-                if (i > 0):
-                    check_data = {"question_number": str(i),
-                                  "question_group": "Life_stage1"}
-                    question = dbQuestion.find_one(check_data)
-                    myReply += answer_record_life_stage_list[i] + "\n"
-                    myReply += "題目:" + question['description'] + "\n"
-                    myReply += "選項:"
-                    if (question['question_type'] == "Life_stage1_multiple"):
-                        if answer_record_life_stage_list[i].split(":")[1] == "":
-                            myReply += "無選擇"
-                        for j in range(len(answer_record_life_stage_list[i].split(":")[1])):
-                            multiple_answer = ",".join(
-                                answer_record_life_stage_list[i].split(":")[1])  # 1,4
-                            multiple_answer = multiple_answer.split(
-                                ",")
-                            answer = "answer"+multiple_answer[j]
-                            myReply += question[answer]+" "
-                        myReply += "\n"
-                    else:
-                        answer = "answer" + \
-                            str(answer_record_life_stage_list[i].split(
-                                ":")[1])
-                        myReply += question[answer] + "\n"
+            # 一次取得所有作答題目
+            questions = question_bank.get_many(
+                "Life_stage1", answers.keys())
+            for question_number, answer in answers.items():
+                question = questions[question_number]
+                myReply += question_number + ":" + answer_text(answer) + "\n"
+                myReply += "題目:" + question['description'] + "\n"
+                myReply += "選項:"
+                if (question['question_type'] == "Life_stage1_multiple"):
+                    if answer == 0:
+                        myReply += "無選擇"
+                    for option in options_text(answer):
+                        myReply += question["answer" + option]+" "
+                    myReply += "\n"
+                else:
+                    myReply += question["answer" + answer] + "\n"
             check_data = {"user_id": event.source.user_id}
             check_options = dbUserRequest.find_one(check_data)
             if check_options["gender"] == "1":
                 sex = "男"
             else:
                 sex = "女"
-            check_data = {"type_name": user_data[0]["life_stage1_type"],
+            check_data = {"type_name": user_data["life_stage1_type"],
                           "insurance_group": "life_stage1_result", "gender": sex}
-            question = dbInsurance.find_one(check_data)
+            question = insurance_advice.find_one(check_data)
             myReply += question["guarantee_direction"] + "\n"
 
         else:
@@ -578,17 +569,18 @@ class Life_stage1_result():
         return myReply
 
     @ staticmethod
+    @timed("render")
     def result_button(check_data, event):
-        user_data = dbUserRequest.find(check_data)
+        user_data = dbUserRequest.find_one(check_data)
         check_data = {"user_id": event.source.user_id}
         check_options = dbUserRequest.find_one(check_data)
         if check_options["gender"] == "1":
             sex = "男"
         else:
             sex = "女"
-        check_data = {"type_name": user_data[0]["life_stage1_type"],
+        check_data = {"type_name": user_data["life_stage1_type"],
                       "insurance_group": "life_stage1_result", "gender": sex}
-        question = dbInsurance.find_one(check_data)
+        question = insurance_advice.find_one(check_data)
         advice = question["insurance_list"].split(",")  # 險種
         data_list = []
         for i in range(len(advice)):
@@ -666,14 +658,15 @@ class Life_stage1_result():
         return advice_button
 
     @ staticmethod
+    @timed("render")
     def result_button2(check_data, event):
-        user_data = dbUserRequest.find(check_data)
+        user_data = dbUserRequest.find_one(check_data)
         check_data = {"user_id": event.source.user_id}
         check_options = dbUserRequest.find_one(check_data)
 
-        check_data = {"type_name": user_data[0]["life_stage2_type"],
+        check_data = {"type_name": user_data["life_stage2_type"],
                       "insurance_group": "life_stage1_result", "gender": check_options["gender"]}
-        question = dbInsurance.find_one(check_data)
+        question = insurance_advice.find_one(check_data)
         advice = question["insurance_list"].split(",")  # 險種
         data_list = []
         for i in range(len(advice)):
@@ -754,7 +747,7 @@ class Life_stage1_result():
 
     @ staticmethod
     def first_time_reply(check_data, myReply):
-        question = dbInsurance.find_one(check_data)
+        question = insurance_advice.find_one(check_data)
         advice = question["insurance_list"].split(",")  # 險種
         data_list = []
         for i in range(len(advice)):
@@ -817,37 +810,26 @@ class Life_stage1_result():
         return first_Reply
 
     @ staticmethod
-    def insurance_1(user_id):  # 意外險
+    def button_advice(user_id):
+        # 依目前進行的人生保險規劃取得險種說明
         question = dbUserRequest.find_one(user_id)
         if question["current_Q"] == "1":
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage1_type"], "button_insurance": "1"})
+            type_name = question["life_stage1_type"]
         else:
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage2_type"], "button_insurance": "1"})
-        return advice["意外險"]
+            type_name = question["life_stage2_type"]
+        return insurance_advice.find_one({"type_name": type_name, "button_insurance": "1"})
+
+    @ staticmethod
+    def insurance_1(user_id):  # 意外險
+        return Life_stage1_result.button_advice(user_id)["意外險"]
 
     @ staticmethod
     def insurance_2(user_id):  # 失能險
-        question = dbUserRequest.find_one(user_id)
-        if question["current_Q"] == "1":
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage1_type"], "button_insurance": "1"})
-        else:
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage2_type"], "button_insurance": "1"})
-        return advice["失能險"]
+        return Life_stage1_result.button_advice(user_id)["失能險"]
 
     @ staticmethod
     def insurance_3(user_id):  # 重大疾病險
-        question = dbUserRequest.find_one(user_id)
-        if question["current_Q"] == "1":
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage1_type"], "button_insurance": "1"})
-        else:
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage2_type"], "button_insurance": "1"})
-        return advice["重大疾病險"]
+        return Life_stage1_result.button_advice(user_id)["重大疾病險"]
 
     @ staticmethod
     def insurance_4(user_id):  # 醫療險
@@ -858,53 +840,25 @@ class Life_stage1_result():
                 preview_image_url="https://i.imgur.com/99BQcEj.jpg"
             )
             return message
-        advice = dbInsurance.find_one(
+        advice = insurance_advice.find_one(
             {"type_name": question["life_stage1_type"], "button_insurance": "1"})
         return advice["醫療險"]
 
     @ staticmethod
     def insurance_5(user_id):  # 壽險
-        question = dbUserRequest.find_one(user_id)
-        if question["current_Q"] == "1":
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage1_type"], "button_insurance": "1"})
-        else:
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage2_type"], "button_insurance": "1"})
-        return advice["壽險"]
+        return Life_stage1_result.button_advice(user_id)["壽險"]
 
     @ staticmethod
     def insurance_6(user_id):  # 癌症險
-        question = dbUserRequest.find_one(user_id)
-        if question["current_Q"] == "1":
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage1_type"], "button_insurance": "1"})
-        else:
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage2_type"], "button_insurance": "1"})
-        return advice["癌症險"]
+        return Life_stage1_result.button_advice(user_id)["癌症險"]
 
     @ staticmethod
     def insurance_7(user_id):  # 終身定期
-        question = dbUserRequest.find_one(user_id)
-        if question["current_Q"] == "1":
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage1_type"], "button_insurance": "1"})
-        else:
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage2_type"], "button_insurance": "1"})
-        return advice["終身定期"]
+        return Life_stage1_result.button_advice(user_id)["終身定期"]
 
     @ staticmethod
     def insurance_8(user_id):  # 婦嬰險
-        question = dbUserRequest.find_one(user_id)
-        if question["current_Q"] == "1":
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage1_type"], "button_insurance": "1"})
-        else:
-            advice = dbInsurance.find_one(
-                {"type_name": question["life_stage2_type"], "button_insurance": "1"})
-        return advice["婦嬰險"]
+        return Life_stage1_result.button_advice(user_id)["婦嬰險"]
 
 # 人生保險規劃2(測試_商院資料5)
 
@@ -914,14 +868,16 @@ class Life_stage2():
         self.user_id = user_id
 
     def content(self):
-        def func_answer_append(user_id):
-            # 獲取進行規劃的使用者資料
-            check_data = {"user_id": user_id}
-            user_data = dbUserRequest.find_one(check_data)
-            # 獲取當前題目
-            check_data = {
-                "question_number": user_data["question_number"], "question_group": "Life_stage2"}
-            qusetion = dbQuestion.find_one(check_data)
+        # 獲取進行規劃的使用者資料
+        check_data = {"user_id": self.user_id}
+        user_data = dbUserRequest.find_one(check_data)
+        # 題目訊息只與題目有關, 取得已製作的訊息
+        return question_messages.get(
+            "Life_stage2", user_data["question_number"], Life_stage2.render)
+
+    @staticmethod
+    def render(qusetion):
+        def func_answer_append(qusetion):
             # 初始化答案清單, 答案回傳清單
             answer_list = []
             answer_return_list = []
@@ -946,7 +902,7 @@ class Life_stage2():
                     answer_list.append(qusetion["answer8"])
                 # 設定按鈕回傳文字
                 answer_text = "ans:" + \
-                    str(user_data["question_number"]) + \
+                    str(qusetion["question_number"]) + \
                     "-" + str(answer_conut + 1)
                 # 答案回傳清單添加回傳文字
                 answer_return_list.append(answer_text)
@@ -956,7 +912,7 @@ class Life_stage2():
         data_list = []
         # 進入函式處理資料, 取得題目字串, 答案清單, 答案回傳清單
         description, answer_list, answer_return_list = func_answer_append(
-            self.user_id)
+            qusetion)
         # 迴圈添加答案進入按鈕清單
         for label_text, return_text in zip(answer_list, answer_return_list):
             data_bubble = {
@@ -971,7 +927,7 @@ class Life_stage2():
                 "adjustMode": "shrink-to-fit"
             }
             data_list.append(data_bubble)
-        flex_message = FlexSendMessage(
+        flex_message = RawFlexSendMessage(
             alt_text='人生保險規劃 退休規劃',
             contents={
                 "type": "bubble",
@@ -1028,7 +984,7 @@ class Life_stage2():
         request_data = dbUserRequest.find_one(check_data)
         check_data = {"insurance_group": "life_stage1_result",
                       "age": "年齡"+request_data["age"]+"歲"}
-        reply_data = dbInsurance.find_one(check_data)
+        reply_data = insurance_advice.find_one(check_data)
         myReply = ""
         myReply += "選擇階段題目："+request_data["life_stage2_type"]+'\n'
         myReply += reply_data["guarantee_direction"]
@@ -1043,6 +999,7 @@ class Life_stage2():
         )
         # TextSendMessage(text=myReply)
 
+    @timed("render")
     def multiple_button():
         flex_message = FlexSendMessage(
             alt_text='青春活力',
@@ -1081,6 +1038,7 @@ class Life_stage2():
         )
         return flex_message
 
+    @timed("render")
     def multiple_button2():
         flex_message = FlexSendMessage(
             alt_text='單身貴族',
@@ -1123,8 +1081,9 @@ class Life_stage2():
 
 class function_list():
 
+    @timed("render")
     def content(self):
-        flex_message = FlexSendMessage(
+        flex_message = RawFlexSendMessage(
             alt_text='hello',
             contents={
                 "type": "carousel",
@@ -1153,8 +1112,7 @@ class function_list():
                                     "weight": "bold",
                                     "size": "xl",
                                     "align": "center",
-                                    "gravity": "center",
-                                    "contents": []
+                                    "gravity": "center"
                                 }
                             ]
                         },
@@ -1213,8 +1171,7 @@ class function_list():
                                     "weight": "bold",
                                     "size": "xl",
                                     "align": "center",
-                                    "gravity": "center",
-                                    "contents": []
+                                    "gravity": "center"
                                 }
                             ]
                         },
@@ -1266,8 +1223,7 @@ class function_list():
                                     "weight": "bold",
                                     "size": "xl",
                                     "align": "center",
-                                    "gravity": "center",
-                                    "contents": []
+                                    "gravity": "center"
                                 }
                             ]
                         },
@@ -1319,8 +1275,7 @@ class function_list():
                                     "weight": "bold",
                                     "size": "xl",
                                     "align": "center",
-                                    "gravity": "center",
-                                    "contents": []
+                                    "gravity": "center"
                                 }
                             ]
                         },
@@ -1373,8 +1328,7 @@ class function_list():
                                     "weight": "bold",
                                     "size": "xl",
                                     "align": "center",
-                                    "gravity": "center",
-                                    "contents": []
+                                    "gravity": "center"
                                 }
                             ]
                         },
@@ -1427,8 +1381,7 @@ class function_list():
                                     "weight": "bold",
                                     "size": "xl",
                                     "align": "center",
-                                    "gravity": "center",
-                                    "contents": []
+                                    "gravity": "center"
                                 }
                             ]
                         },
@@ -1499,8 +1452,7 @@ class function_list():
                                     "weight": "bold",
                                     "size": "xl",
                                     "align": "center",
-                                    "gravity": "center",
-                                    "contents": []
+                                    "gravity": "center"
                                 }
                             ]
                         },
@@ -0,0 +1,313 @@
+# -*- coding: utf8 -*-
+""" 處理階段延遲統計, 以 Prometheus 文字格式輸出 """
+import bisect
+import configparser
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Text, Tuple
+
+from request_context import current_context
+
+
+# config 環境設定解析
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+# 關閉時計時器不記錄, /metrics 回應 404
+enabled = config.getboolean('metrics', 'enabled', fallback=True)
+# 單一事件的 MongoDB 指令數上限, 超過時記錄警告, 0 表示不檢查
+event_command_budget = config.getint('metrics', 'event_command_budget', fallback=10)
+
+logger = logging.getLogger(__name__)
+
+# 不屬於任何意圖, 如簽章驗證與背景工作
+NO_INTENT = "none"
+
+# 秒
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Text) -> Text:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> Text:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Histogram():
+    """
+    class:
+        Histogram -- Prometheus histogram kept in process memory
+
+        One bucket count list per label values; an observation is a bisect
+        and three additions under a lock. Every gunicorn worker keeps its own
+        counts, each scrape reads the worker that answers it.
+
+        method:
+            observe(labels: Tuple[Text, ...], value: float) -> None:
+                Count one observation.
+
+            collect() -> List[Text]:
+                Exposition lines of the histogram.
+    """
+
+    def __init__(self, name: Text, documentation: Text, labelnames: Sequence[Text],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Args:
+            name (Text): metric name
+            documentation (Text): HELP text
+            labelnames (Sequence[Text]): label names, in the order of the label values
+            buckets (Sequence[float], optional): upper bounds in ascending order. Defaults to DEFAULT_BUCKETS.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[Text, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[Text, ...], value: float) -> None:
+        """Count one observation.
+
+        Args:
+            labels (Tuple[Text, ...]): label values
+            value (float): observed value
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [各區間次數 (最後為 +Inf), 總和]
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self) -> List[Text]:
+        """Exposition lines of the histogram.
+
+        Returns:
+            List[Text]: HELP, TYPE and sample lines
+        """
+        with self._lock:
+            snapshot = [(labels, list(counts), total)
+                        for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        for labels, counts, total in sorted(snapshot):
+            pairs = ",".join(f'{name}="{_escape(value)}"'
+                             for name, value in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{pairs},le="{_number(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{pairs}}} {_number(total)}")
+            lines.append(f"{self.name}_count{{{pairs}}} {cumulative}")
+        return lines
+
+
+class MetricsRegistry():
+    """
+    class:
+        MetricsRegistry -- Metrics exposed by /metrics
+
+        method:
+            register(metric: Histogram) -> Histogram:
+                Add a metric.
+
+            render() -> Text:
+                All metrics in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: List[Histogram] = []
+
+    def register(self, metric: Histogram) -> Histogram:
+        """Add a metric.
+
+        Args:
+            metric (Histogram): metric
+
+        Returns:
+            Histogram: the same metric
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> Text:
+        """All metrics in the Prometheus text format.
+
+        Returns:
+            Text: exposition text, version 0.0.4
+        """
+        lines = []
+        for metric in self._metrics:
+            lines += metric.collect()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 各處理階段延遲, 階段可能重疊 (如 render 包含讀取使用者資料, session 包含 mongodb)
+# signature: 簽章驗證與事件解析; route: 文字意圖比對; session: 讀取使用者資料;
+# mongodb: 每次資料庫指令; render: 製作訊息; line_reply: 呼叫 LINE 訊息 API;
+# mail: 寄送退休財務規劃結果; event: 處理整個事件
+stage_latency = registry.register(Histogram(
+    "linebot_stage_duration_seconds",
+    "Latency of webhook processing stages by intent.",
+    ("intent", "stage")))
+
+# 每個事件的 MongoDB 指令數與位元組數
+event_commands = registry.register(Histogram(
+    "linebot_event_mongodb_commands",
+    "MongoDB commands sent per webhook event by intent.",
+    ("intent",), buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32)))
+event_command_bytes = registry.register(Histogram(
+    "linebot_event_mongodb_bytes",
+    "BSON bytes of MongoDB commands and replies per webhook event by intent.",
+    ("intent",), buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304)))
+
+
+def set_intent(intent: Text) -> None:
+    """Label the timings of the current event with an intent.
+
+    The last intent set before the event finishes is used, e.g. an answer
+    message is relabelled with the analysis the user is answering.
+
+    Args:
+        intent (Text): intent name, e.g. 適合性分析
+    """
+    context = current_context()
+    if context is not None:
+        context.intent = intent
+
+
+def observe_stage(stage: Text, seconds: float, intent: Optional[Text] = None) -> None:
+    """Record the latency of a stage.
+
+    Inside a request context the timing is kept until the event finishes
+    and recorded with the intent of the event.
+
+    Args:
+        stage (Text): stage name
+        seconds (float): latency
+        intent (Optional[Text], optional): intent label, instead of the event's. Defaults to None.
+    """
+    if not enabled:
+        return
+    if intent is None:
+        context = current_context()
+        if context is not None:
+            context.timings.append((stage, seconds))
+            return
+        intent = NO_INTENT
+    stage_latency.observe((intent, stage), seconds)
+
+
+class stage_timer():
+    """
+    class:
+        stage_timer -- Context manager recording the latency of a stage
+
+        with stage_timer("route"):
+            ...
+    """
+    __slots__ = ("stage", "intent", "_started")
+
+    def __init__(self, stage: Text, intent: Optional[Text] = None):
+        self.stage = stage
+        self.intent = intent
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe_stage(self.stage, time.perf_counter() - self._started, self.intent)
+        return False
+
+
+def timed(stage: Text, intent: Optional[Text] = None) -> Callable:
+    """Decorator recording the latency of every call as a stage.
+
+    Args:
+        stage (Text): stage name
+        intent (Optional[Text], optional): intent label, instead of the event's. Defaults to None.
+
+    Returns:
+        Callable: decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe_stage(stage, time.perf_counter() - started, intent)
+        return wrapper
+    return decorator
+
+
+def _record_event(context, elapsed: float) -> None:
+    intent = context.intent or NO_INTENT
+    if enabled:
+        timings, context.timings = context.timings, []
+        timings.append(("event", elapsed))
+        for stage, seconds in timings:
+            stage_latency.observe((intent, stage), seconds)
+        event_commands.observe((intent,), context.commands)
+        event_command_bytes.observe((intent,), context.command_bytes)
+    counts = {"intent": intent, "mongodb_commands": context.commands,
+              "mongodb_bytes": context.command_bytes,
+              "mongodb_ms": round(context.command_seconds * 1000, 1)}
+    logger.info("Event %s %.1f ms, %d MongoDB commands, %d bytes, %.1f ms",
+                intent, elapsed * 1000, context.commands, context.command_bytes,
+                context.command_seconds * 1000, extra=counts)
+    if 0 < event_command_budget < context.commands:
+        logger.warning("Event %s sent %d MongoDB commands, over the budget of %d",
+                       intent, context.commands, event_command_budget, extra=counts)
+
+
+def timed_event(func: Callable) -> Callable:
+    """Decorator recording a webhook event and the stages kept during it.
+
+    Also logs the MongoDB commands, bytes and round trip time of the event,
+    with the counts as attributes of the log record, and warns when the
+    commands are over `event_command_budget`. Use inside
+    `with_request_context`, so the context is still open when the event
+    finishes.
+
+    Args:
+        func (Callable): function taking the webhook event
+
+    Returns:
+        Callable: wrapped function
+    """
+    @functools.wraps(func)
+    def wrapper(event):
+        started = time.perf_counter()
+        try:
+            return func(event)
+        finally:
+            elapsed = time.perf_counter() - started
+            context = current_context()
+            if context is None:
+                observe_stage("event", elapsed)
+            else:
+                _record_event(context, elapsed)
+    return wrapper
+
+
+def render_metrics() -> Text:
+    """All metrics in the Prometheus text format.
+
+    Returns:
+        Text: exposition text
+    """
+    return registry.render()
@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+""" 作答紀錄轉換: "-1:2-2:3" 字串轉為 題號 -> 答案 的物件, 複選題轉為位元遮罩
+
+執行:
+    python migrate_answer_records.py [--dry-run]
+"""
+import argparse
+import logging
+
+from pymongo import UpdateOne
+
+from answer_record import ANSWER_FIELDS, load_answers, load_options
+from database import get_collection
+
+
+logger = logging.getLogger(__name__)
+
+
+def convert(document: dict) -> dict:
+    """Fields of a `user-request` document still in the old format, converted.
+
+    Args:
+        document (dict): user-request document
+
+    Returns:
+        dict: field -> new value, empty if nothing to convert
+    """
+    changes = {}
+    for field, question_group in ANSWER_FIELDS.items():
+        if isinstance(document.get(field), str):
+            changes[field] = load_answers(document[field], question_group)
+    if isinstance(document.get("multiple_options"), str):
+        changes["multiple_options"] = load_options(
+            document["multiple_options"])
+    return changes
+
+
+def migrate(dry_run: bool = False, batch_size: int = 500) -> int:
+    """Convert every `user-request` document in the old format.
+
+    Documents already converted are left alone, so it is safe to run again.
+
+    Args:
+        dry_run (bool, optional): only count the documents. Defaults to False.
+        batch_size (int, optional): updates per bulk write. Defaults to 500.
+
+    Returns:
+        int: number of documents converted
+    """
+    collection = get_collection('user-request')
+    fields = list(ANSWER_FIELDS) + ["multiple_options"]
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    converted = 0
+    requests = []
+    for document in collection.find(query, projection):
+        changes = convert(document)
+        if not changes:
+            continue
+        converted += 1
+        # 只在欄位仍是舊格式時更新, 避免覆蓋轉換期間的新作答
+        requests.append(UpdateOne(
+            {"_id": document["_id"], **{field: document[field] for field in changes}},
+            {"$set": changes}))
+        if len(requests) >= batch_size:
+            if not dry_run:
+                collection.bulk_write(requests, ordered=False)
+            requests = []
+    if requests and not dry_run:
+        collection.bulk_write(requests, ordered=False)
+    return converted
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Convert answer records of user-request to the structured format")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="count the documents without writing")
+    args = parser.parse_args()
+    logger.info("%s %d documents", "Would convert" if args.dry_run else "Converted",
+                migrate(dry_run=args.dry_run))
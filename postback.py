@@ -0,0 +1,123 @@
+# -*- coding: utf8 -*-
+""" Postback 資料編碼與解析 """
+import ast
+import configparser
+import logging
+from typing import Dict, Text
+
+from catalog import question_bank
+
+
+# config 環境設定解析
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+logger = logging.getLogger(__name__)
+
+# 格式版本, 欄位配置改變時增加
+VERSION = "1"
+SEPARATOR = "|"
+# LINE postback data 長度上限
+MAX_LENGTH = 300
+
+# 功能代號 -> (group, 欄位名稱)
+_LAYOUTS = {
+    "gg": ("Guarantee_gap", ("question_number", "answer_number")),
+    "jf": ("Joint_financial", ("question_field",)),
+    "jo": ("Joint_financial", ("option",)),
+}
+_TAGS = {(group, fields): tag for tag, (group, fields) in _LAYOUTS.items()}
+
+
+class PostbackError(ValueError):
+    """Postback data that can not be decoded or does not match the question bank."""
+
+
+def encode(data: Dict[Text, Text]) -> Text:
+    """Encode postback data, e.g. `1|gg|7|2`.
+
+    Args:
+        data (Dict[Text, Text]): group and fields, same keys as `decode` returns
+
+    Raises:
+        PostbackError: unknown layout, or a value containing the separator
+
+    Returns:
+        Text: postback data
+    """
+    fields = tuple(key for key in data if key != "group")
+    tag = _TAGS.get((data.get("group"), fields))
+    if tag is None:
+        raise PostbackError(f"No postback layout of {data}")
+    values = [str(data[field]) for field in fields]
+    if any(SEPARATOR in value for value in values):
+        raise PostbackError(f"Postback value contains {SEPARATOR!r}: {data}")
+    encoded = SEPARATOR.join([VERSION, tag] + values)
+    if len(encoded) > MAX_LENGTH:
+        raise PostbackError(f"Postback data longer than {MAX_LENGTH}")
+    return encoded
+
+
+def _validate(data: Dict[Text, Text]) -> Dict[Text, Text]:
+    if "question_number" in data:
+        question = question_bank.get(
+            "guarantee_gap_analysis", data["question_number"])
+        answer = data["answer_number"]
+        if question is None or not answer.isdigit() or not 1 <= int(answer) <= int(question["answer_sum"]):
+            raise PostbackError(f"No guarantee gap answer {data}")
+    elif "question_field" in data:
+        if question_bank.get_by_field("joint_financial_planning", data["question_field"]) is None:
+            raise PostbackError(f"No joint financial field {data}")
+    elif "option" in data:
+        if not data["option"].isdigit() or len(data["option"]) > 2:
+            raise PostbackError(f"Invalid option {data}")
+    return data
+
+
+def _decode_legacy(data: Text) -> Dict[Text, Text]:
+    # 舊版 str(dict) 格式, 只接受字串常值
+    try:
+        value = ast.literal_eval(data)
+    except (ValueError, SyntaxError, MemoryError, RecursionError) as error:
+        raise PostbackError(f"Invalid legacy postback {data[:50]!r}") from error
+    if not isinstance(value, dict) or not all(isinstance(key, str) and isinstance(item, str)
+                                              for key, item in value.items()):
+        raise PostbackError(f"Invalid legacy postback {data[:50]!r}")
+    fields = tuple(key for key in value if key != "group")
+    if (value.get("group"), fields) not in _TAGS:
+        raise PostbackError(f"No postback layout of {data[:50]!r}")
+    return value
+
+
+def decode(data: Text, accept_legacy: bool = None) -> Dict[Text, Text]:
+    """Decode and validate postback data.
+
+    Args:
+        data (Text): event.postback.data
+        accept_legacy (bool, optional): also read `str(dict)` data of old bubbles. Defaults to [postback] accept_legacy.
+
+    Raises:
+        PostbackError: data can not be decoded or does not match the question bank
+
+    Returns:
+        Dict[Text, Text]: group and fields, e.g. {"group": "Guarantee_gap", "question_number": "7", "answer_number": "2"}
+    """
+    if accept_legacy is None:
+        accept_legacy = config.getboolean(
+            'postback', 'accept_legacy', fallback=True)
+    if len(data) > MAX_LENGTH:
+        raise PostbackError(f"Postback data longer than {MAX_LENGTH}")
+    if data.startswith("{"):
+        if not accept_legacy:
+            raise PostbackError(f"Legacy postback {data[:50]!r}")
+        logger.info("Legacy postback %r", data[:50])
+        return _validate(_decode_legacy(data))
+    parts = data.split(SEPARATOR)
+    if len(parts) < 2 or parts[0] != VERSION or parts[1] not in _LAYOUTS:
+        raise PostbackError(f"Unknown postback {data[:50]!r}")
+    group, fields = _LAYOUTS[parts[1]]
+    if len(parts) != len(fields) + 2:
+        raise PostbackError(f"Invalid postback {data[:50]!r}")
+    decoded = {"group": group}
+    decoded.update(zip(fields, parts[2:]))
+    return _validate(decoded)
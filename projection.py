@@ -0,0 +1,113 @@
+# -*- coding: utf8 -*-
+""" 退休資產試算 """
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, NamedTuple, Sequence, Union
+
+try:
+    import numpy as np
+except ImportError:  # 只有批次試算需要 numpy
+    np = None
+
+
+class YearProjection(NamedTuple):
+    """
+    class:
+        YearProjection -- Projection of one year
+
+        attribute:
+            year (int): years from now, 0 is this year
+            cpi_index (Decimal): (1 + CPI) ^ year
+            income (Decimal): salary, other income and return of last year's asset
+            expenditure (Decimal): CPI adjusted cost and other expenditure, plus loan
+            asset (Decimal): accumulated asset at the end of the year
+    """
+    year: int
+    cpi_index: Decimal
+    income: Decimal
+    expenditure: Decimal
+    asset: Decimal
+
+
+def project_assets(user_data: Dict, years: int) -> List[YearProjection]:
+    """Project the total assets year by year with exact Decimal arithmetic.
+
+    Args:
+        user_data (Dict): user's joint financial data
+        years (int): last year to project
+
+    Returns:
+        List[YearProjection]: projection of year 0 to `years`
+    """
+    ten_thousand = Decimal("10000")
+    cent = Decimal('.00')
+    growth = Decimal("1") + Decimal(user_data['CPI'])/Decimal("100")
+    roi = Decimal(user_data['ROI'])
+    fixed_income = Decimal(user_data['salary'])*ten_thousand + \
+        Decimal(user_data['income'])*ten_thousand
+    living_cost = Decimal(user_data['cost']) * ten_thousand + \
+        Decimal(user_data['expenditure']) * ten_thousand
+    loan = Decimal(user_data['loan'])*ten_thousand
+
+    last_year_asset = Decimal(user_data['investable_amount'])*ten_thousand
+    series = []
+    for year in range(years + 1):
+        # 通貨膨脹指數 = (1 + <通貨膨脹指數>) ^ <年數>
+        cpi_index = growth**year
+        # 年收入 = ( <薪資年收入> + <其他年收入> + <去年累績結餘> * <投資年報酬率> )
+        income = (fixed_income +
+                  (last_year_asset * roi // Decimal("100"))).quantize(cent, ROUND_HALF_UP)
+        # 年費用 = ( <家用年費用> + <其他年費用> ) * <通貨膨脹指數> + <貸款年費用>
+        expenditure = (living_cost * cpi_index +
+                       loan).quantize(cent, ROUND_HALF_UP)
+        # <累績結餘> = <去年累積結餘> + <年收入> - <年費用>
+        last_year_asset = last_year_asset + income - expenditure
+        series.append(YearProjection(
+            year, cpi_index, income, expenditure, last_year_asset))
+    return series
+
+
+def _round_half_up(values, digits: int = 2):
+    scale = 10 ** digits
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+def project_assets_bulk(user_data: Dict[str, Union[float, Sequence[float]]], years: int):
+    """Project many scenarios at once with NumPy floats.
+
+    Every field may be a number or a sequence with one value per scenario,
+    e.g. several ROI values for a what-if table. Results follow the same
+    formula as `project_assets` but in float, use `project_assets` for the
+    number shown to the user.
+
+    Args:
+        user_data (Dict[str, Union[float, Sequence[float]]]): joint financial data of the scenarios
+        years (int): last year to project
+
+    Raises:
+        RuntimeError: numpy is not installed
+
+    Returns:
+        numpy.ndarray: assets of shape (scenarios, years + 1)
+    """
+    if np is None:
+        raise RuntimeError("project_assets_bulk requires numpy")
+    fields = {key: np.atleast_1d(np.asarray(user_data[key], dtype=float))
+              for key in ("CPI", "ROI", "salary", "income", "cost", "expenditure", "loan", "investable_amount")}
+    scenarios = np.broadcast(*fields.values()).shape[0]
+    fields = {key: np.broadcast_to(value, (scenarios,))
+              for key, value in fields.items()}
+
+    growth = 1 + fields['CPI'] / 100
+    fixed_income = (fields['salary'] + fields['income']) * 10000
+    living_cost = (fields['cost'] + fields['expenditure']) * 10000
+    loan = fields['loan'] * 10000
+
+    assets = np.empty((scenarios, years + 1))
+    last_year_asset = fields['investable_amount'] * 10000
+    for year in range(years + 1):
+        income = _round_half_up(
+            fixed_income + np.trunc(last_year_asset * fields['ROI'] / 100))
+        expenditure = _round_half_up(living_cost * growth**year + loan)
+        last_year_asset = last_year_asset + income - expenditure
+        assets[:, year] = last_year_asset
+    return assets
@@ -0,0 +1,171 @@
+# -*- coding: utf8 -*-
+""" 資料庫索引建立與查詢計畫檢查
+
+建立程式需要的索引 (已存在時不變), 並以 explain() 檢查每種查詢條件,
+任何查詢使用 COLLSCAN 時以非 0 結束.
+
+執行:
+    python provision_indexes.py [--check-only]
+"""
+import argparse
+import logging
+import sys
+from typing import Dict, Iterator, List, Optional, Text, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.database import Database
+
+from database import get_database
+
+
+logger = logging.getLogger(__name__)
+
+# collection -> 需要的索引
+INDEXES = {
+    "user-request": [
+        # 也用於只查 user_id 的查詢
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING)],
+                   name="user_id_status"),
+    ],
+    "qusetion-database": [
+        IndexModel([("question_group", ASCENDING), ("question_number", ASCENDING)],
+                   name="question_group_number"),
+        IndexModel([("question_group", ASCENDING), ("field_name", ASCENDING)],
+                   name="question_group_field"),
+    ],
+    "insurance-advice": [
+        IndexModel([("insurance_group", ASCENDING), ("type_name", ASCENDING), ("gender", ASCENDING)],
+                   name="insurance_group_type_gender"),
+        IndexModel([("insurance_group", ASCENDING), ("gender", ASCENDING), ("lower_age", DESCENDING)],
+                   name="insurance_group_gender_age"),
+        IndexModel([("insurance_group", ASCENDING), ("lower_age", DESCENDING), ("lower_guarantee_gap", DESCENDING)],
+                   name="insurance_group_age_gap"),
+        IndexModel([("insurance_group", ASCENDING), ("age", ASCENDING)],
+                   name="insurance_group_age_text"),
+        IndexModel([("type_name", ASCENDING), ("button_insurance", ASCENDING)],
+                   name="type_name_button"),
+    ],
+    "investment-advice": [
+        IndexModel([("suitability_analysis_type", ASCENDING)],
+                   name="suitability_analysis_type"),
+    ],
+}
+
+# 程式送出的查詢條件: (collection, filter, sort)
+# 快取 (catalog) 整份讀取的 find({}) 不在此列, 其查詢條件為快取內的查詢
+QUERY_SHAPES = [
+    ("user-request", {"user_id": "U0"}, None),
+    ("user-request", {"user_id": "U0", "status": "Guarantee_gap_analysis"}, None),
+    ("qusetion-database",
+     {"question_group": "Life_stage1", "question_number": {"$in": ["1", "2"]}}, None),
+    ("qusetion-database",
+     {"question_group": "joint_financial_planning", "field_name": "age"}, None),
+    ("insurance-advice",
+     {"type_name": "退休", "insurance_group": "joint_financial_planning"}, None),
+    ("insurance-advice",
+     {"type_name": "退休", "insurance_group": "life_stage1_result", "gender": "男"}, None),
+    ("insurance-advice", {"type_name": "退休", "button_insurance": "1"}, None),
+    ("insurance-advice",
+     {"insurance_group": "life_stage1_result", "age": "年齡66+歲"}, None),
+    ("insurance-advice",
+     {"insurance_group": "insurance_type_and_cost", "lower_age": {"$lte": 30}, "lower_guarantee_gap": {"$lte": 400}},
+     [("lower_age", DESCENDING), ("lower_guarantee_gap", DESCENDING)]),
+    ("insurance-advice",
+     {"insurance_group": "insurance_detail", "lower_age": {"$lte": 30}, "upper_age": {"$gte": 30}}, None),
+    ("insurance-advice",
+     {"insurance_group": "joint_financial_planning", "lower_age": {"$lte": 30}, "gender": "1"},
+     [("lower_age", DESCENDING)]),
+    ("investment-advice", {"suitability_analysis_type": "穩健型"}, None),
+]
+
+
+class QueryPlanError(RuntimeError):
+    """Query shapes that scan the whole collection."""
+
+
+def ensure_indexes(database: Database) -> List[Text]:
+    """Create the declared indexes.
+
+    Creating an index that already exists with the same keys and options
+    does nothing; a conflicting index raises `OperationFailure`.
+
+    Args:
+        database (Database): bot database
+
+    Returns:
+        List[Text]: names of the declared indexes
+    """
+    names = []
+    for collection_name, indexes in INDEXES.items():
+        names += database[collection_name].create_indexes(indexes)
+        logger.info("%s: %s", collection_name, ", ".join(
+            index.document["name"] for index in indexes))
+    return names
+
+
+def _stages(plan) -> Iterator[Text]:
+    # 逐層取出查詢計畫的 stage, 包含 inputStage / inputStages / queryPlan
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+def explain_stages(database: Database, collection_name: Text, filter: Dict,
+                   sort: Optional[List[Tuple[Text, int]]] = None) -> List[Text]:
+    """Stages of the winning plan of a query.
+
+    Args:
+        database (Database): bot database
+        collection_name (Text): collection name
+        filter (Dict): query filter
+        sort (Optional[List[Tuple[Text, int]]], optional): sort of the query. Defaults to None.
+
+    Returns:
+        List[Text]: stage names, outermost first
+    """
+    cursor = database[collection_name].find(filter)
+    if sort:
+        cursor = cursor.sort(sort)
+    return list(_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+
+
+def check_query_plans(database: Database) -> None:
+    """Explain every query shape of `QUERY_SHAPES`.
+
+    Args:
+        database (Database): bot database
+
+    Raises:
+        QueryPlanError: a query shape would scan the whole collection
+    """
+    scans = []
+    for collection_name, filter, sort in QUERY_SHAPES:
+        stages = explain_stages(database, collection_name, filter, sort)
+        logger.info("%s %s: %s", collection_name, filter, " <- ".join(stages))
+        if "COLLSCAN" in stages:
+            scans.append(f"{collection_name} {filter}")
+    if scans:
+        raise QueryPlanError("COLLSCAN in " + "; ".join(scans))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Create the indexes of the bot database and check the query plans")
+    parser.add_argument("--check-only", action="store_true",
+                        help="only explain the queries, do not create indexes")
+    args = parser.parse_args()
+    database = get_database()
+    if not args.check_only:
+        ensure_indexes(database)
+    try:
+        check_query_plans(database)
+    except QueryPlanError as error:
+        logger.error("%s", error)
+        sys.exit(1)
+    logger.info("No query shape scans a whole collection")
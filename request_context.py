@@ -0,0 +1,117 @@
+# -*- coding: utf8 -*-
+""" 單一事件的使用者請求資料 """
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Text, Tuple
+
+
+class RequestContext():
+    """
+    class:
+        RequestContext -- `user-request` document of the user handling one event
+
+        The document is loaded on first use and kept until the event is
+        handled, so every module reading the same user shares one query.
+
+        attribute:
+            user_id (Text): event.source.user_id
+            event_time (float): epoch seconds of the webhook event, None if unknown
+            loaded (bool): whether the document was loaded
+            document (Dict): user document, None if the user has none
+            loads (int): how many times the document was loaded
+            intent (Text): intent of the event, label of its stage timings
+            timings (List[Tuple[Text, float]]): stage timings kept until the event finishes
+            commands (int): MongoDB commands sent for the event
+            command_bytes (int): BSON bytes of the commands and their replies
+            command_seconds (float): round trip time of the commands
+
+        method:
+            load(loader: Callable) -> Dict:
+                Load the document if it was not loaded.
+
+            discard() -> None:
+                Forget the document, load it again on next use.
+    """
+
+    def __init__(self, user_id: Text, event_time: float = None):
+        self.user_id = user_id
+        self.event_time = event_time
+        self.loaded = False
+        self.document = None
+        self.loads = 0
+        self.intent = None
+        self.timings: List[Tuple[Text, float]] = []
+        self.commands = 0
+        self.command_bytes = 0
+        self.command_seconds = 0.0
+
+    def load(self, loader: Callable[[Text], Optional[Dict]]) -> Optional[Dict]:
+        """Load the document if it was not loaded.
+
+        Args:
+            loader (Callable[[Text], Optional[Dict]]): function reading the document of a user id
+
+        Returns:
+            Dict: user document, None if the user has none
+        """
+        if not self.loaded:
+            self.document = loader(self.user_id)
+            self.loaded = True
+            self.loads += 1
+        return self.document
+
+    def discard(self) -> None:
+        """Forget the document, load it again on next use."""
+        self.loaded = False
+        self.document = None
+
+
+_local = threading.local()
+
+
+def current_context() -> Optional[RequestContext]:
+    """Get the context of the event handled by this thread.
+
+    Returns:
+        RequestContext: current context, None outside of an event
+    """
+    return getattr(_local, "context", None)
+
+
+@contextmanager
+def user_request_context(user_id: Text, event_time: float = None):
+    """Open a context for one event of a user.
+
+    Args:
+        user_id (Text): event.source.user_id
+        event_time (float, optional): epoch seconds of the webhook event. Defaults to None.
+    """
+    previous = current_context()
+    context = RequestContext(user_id, event_time) if user_id else None
+    _local.context = context
+    try:
+        yield context
+    finally:
+        _local.context = previous
+
+
+def with_request_context(func: Callable) -> Callable:
+    """Decorator running a webhook event function inside a request context.
+
+    Args:
+        func (Callable): function taking the webhook event
+
+    Returns:
+        Callable: wrapped function
+    """
+    # 只接受 event 一個參數: WebhookHandler 依參數個數決定是否傳入 destination
+    @functools.wraps(func)
+    def wrapper(event):
+        source = getattr(event, "source", None)
+        # event.timestamp 為毫秒
+        timestamp = getattr(event, "timestamp", None)
+        with user_request_context(getattr(source, "user_id", None),
+                                  timestamp / 1000 if timestamp else None):
+            return func(event)
+    return wrapper
@@ -0,0 +1,216 @@
+# -*- coding: utf8 -*-
+""" 文字訊息意圖路由 """
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set, Text
+
+
+class Intent():
+    """
+    class:
+        Intent -- One route of the text message router
+
+        attribute:
+            name (Text): intent name
+            keywords (List[Text]): literal keywords, any of them selects the intent
+            patterns (List[Text]): regular expressions, any of them selects the intent
+            excludes (List[Text]): literal keywords that must not appear in the text
+            priority (int): larger priority wins when several intents match
+            handler (Callable): function handling the message
+    """
+    __slots__ = ("name", "keywords", "patterns", "excludes",
+                 "priority", "order", "handler")
+
+    def __init__(self, name: Text, keywords: Iterable[Text], patterns: Iterable[Text],
+                 excludes: Iterable[Text], priority: int, order: int):
+        self.name = name
+        self.keywords = list(keywords)
+        self.patterns = list(patterns)
+        self.excludes = list(excludes)
+        self.priority = priority
+        self.order = order
+        self.handler = None
+
+    def __repr__(self):
+        return f"Intent({self.name!r}, priority={self.priority})"
+
+
+class IntentRouter():
+    """
+    class:
+        IntentRouter -- Match a text message against all intents in one pass
+
+        Every keyword and pattern becomes one branch of a single compiled
+        regular expression, scanned once over the text. Literal keywords that
+        are a prefix of a longer matched keyword are counted as found too, so
+        the result is the same as searching every keyword separately.
+
+        method:
+            add(name: Text, keywords=(), patterns=(), excludes=(), priority: int = 0) -> Intent:
+                Register an intent.
+
+            handler(name: Text) -> Callable:
+                Decorator binding a handler function to a registered intent.
+
+            scan(text: Text) -> Set[Text]:
+                Keywords and patterns found in the text.
+
+            match(text: Text) -> Intent:
+                The intent with the highest priority, None if nothing matches.
+    """
+
+    def __init__(self):
+        self._intents: Dict[Text, Intent] = {}
+        self._compiled = None
+        self._group_tokens: Dict[Text, Text] = {}
+        self._implied: Dict[Text, Set[Text]] = {}
+        self._token_intents: Dict[Text, List[Intent]] = {}
+
+    def add(self, name: Text, keywords: Iterable[Text] = (), patterns: Iterable[Text] = (),
+            excludes: Iterable[Text] = (), priority: int = 0) -> Intent:
+        """Register an intent.
+
+        Args:
+            name (Text): intent name
+            keywords (Iterable[Text], optional): literal keywords. Defaults to ().
+            patterns (Iterable[Text], optional): regular expressions. Defaults to ().
+            excludes (Iterable[Text], optional): literal keywords that must not appear. Defaults to ().
+            priority (int, optional): larger priority wins. Defaults to 0.
+
+        Returns:
+            Intent: registered intent
+        """
+        if name in self._intents:
+            raise ValueError(f"Intent {name} already registered")
+        intent = Intent(name, keywords, patterns, excludes,
+                        priority, len(self._intents))
+        self._intents[name] = intent
+        self._compiled = None
+        return intent
+
+    def handler(self, name: Text) -> Callable:
+        """Decorator binding a handler function to a registered intent.
+
+        Args:
+            name (Text): intent name
+
+        Returns:
+            Callable: decorator
+        """
+        def decorator(func):
+            self._intents[name].handler = func
+            return func
+        return decorator
+
+    @property
+    def intents(self) -> List[Intent]:
+        return sorted(self._intents.values(), key=lambda intent: (-intent.priority, intent.order))
+
+    def compile(self) -> None:
+        """Build the combined regular expression."""
+        literals = set()
+        patterns = set()
+        token_intents: Dict[Text, List[Intent]] = {}
+        for intent in self.intents:
+            for keyword in intent.keywords:
+                literals.add(keyword)
+                token_intents.setdefault(keyword, []).append(intent)
+            for pattern in intent.patterns:
+                patterns.add(pattern)
+                token_intents.setdefault(pattern, []).append(intent)
+            literals.update(intent.excludes)
+
+        # 長的關鍵字放前面, 同一位置優先比對較長的字
+        branches = [(keyword, re.escape(keyword))
+                    for keyword in sorted(literals, key=lambda keyword: (-len(keyword), keyword))]
+        branches += [(pattern, pattern) for pattern in sorted(patterns)]
+        group_tokens = {}
+        parts = []
+        for index, (token, source) in enumerate(branches):
+            group_tokens[f"t{index}"] = token
+            parts.append(f"(?P<t{index}>{source})")
+        # 零寬度前瞻, 每個位置都比對一次
+        self._compiled = re.compile("(?=(?:" + "|".join(parts) + "))") if parts else None
+        self._group_tokens = group_tokens
+        self._implied = {keyword: {other for other in literals if other != keyword and keyword.startswith(other)}
+                         for keyword in literals}
+        self._token_intents = token_intents
+
+    def scan(self, text: Text) -> Set[Text]:
+        """Keywords and patterns found in the text.
+
+        Args:
+            text (Text): message text
+
+        Returns:
+            Set[Text]: found keywords and patterns
+        """
+        if self._compiled is None:
+            self.compile()
+            if self._compiled is None:
+                return set()
+        found = set()
+        for match in self._compiled.finditer(text):
+            token = self._group_tokens[match.lastgroup]
+            if token not in found:
+                found.add(token)
+                found.update(self._implied.get(token, ()))
+        return found
+
+    def match(self, text: Text) -> Optional[Intent]:
+        """The intent with the highest priority.
+
+        Args:
+            text (Text): message text
+
+        Returns:
+            Intent: matched intent, None if nothing matches
+        """
+        found = self.scan(text)
+        best = None
+        for token in found:
+            for intent in self._token_intents.get(token, ()):
+                if best is not None and (-intent.priority, intent.order) >= (-best.priority, best.order):
+                    continue
+                if any(exclude in found for exclude in intent.excludes):
+                    continue
+                best = intent
+        return best
+
+
+# 文字訊息路由表, 優先度越大越先比對
+intent_router = IntentRouter()
+intent_router.add("功能列表", patterns=["[功]+[能]+[列]+[表]+"], priority=300)
+intent_router.add("使用說明", patterns=["[使]+[用]+[說]+[明]+"], priority=290)
+intent_router.add("認識我們", patterns=["[認]+[識]+[我]+[們]+"], priority=280)
+intent_router.add("適合性分析", keywords=["適合性分析"],
+                  excludes=["適合性分析結果"], priority=270)
+intent_router.add("汽車保險規劃", keywords=["汽車保險規劃"],
+                  excludes=["汽車保險規劃結果"], priority=260)
+intent_router.add("汽車保險規劃結果", keywords=["汽車保險規劃結果"], priority=250)
+intent_router.add("人生保險規劃", keywords=["人生保險規劃"],
+                  excludes=["人生保險規劃紀錄", "退休規劃"], priority=240)
+intent_router.add("人生保險規劃 退休規劃", keywords=["人生保險規劃 退休規劃"],
+                  excludes=["人生保險規劃 退休規劃紀錄"], priority=230)
+intent_router.add("保障缺口分析", keywords=["保障缺口分析"], priority=220)
+intent_router.add("退休財務規劃", keywords=["退休財務規劃"], priority=210)
+intent_router.add("保障缺口紀錄", keywords=["保障缺口紀錄"], priority=200)
+intent_router.add("退休財務紀錄", keywords=["退休財務紀錄"], priority=190)
+intent_router.add("退休資產", keywords=["退休資產"], priority=180)
+intent_router.add("寄送狀態", keywords=["寄送狀態"], priority=175)
+intent_router.add("險種說明", keywords=["ex:"], priority=170)
+intent_router.add("婦嬰險", keywords=["婦嬰險"], priority=160)
+intent_router.add("醫療險", keywords=["醫療險"], priority=150)
+intent_router.add("終身定期", keywords=["終身定期"], priority=140)
+intent_router.add("癌症險", keywords=["癌症險"], priority=130)
+intent_router.add("重大疾病險", keywords=["重大疾病險"], priority=120)
+intent_router.add("意外險", keywords=["意外險"], priority=110)
+intent_router.add("失能險", keywords=["失能險"], priority=100)
+intent_router.add("壽險", keywords=["壽險"], priority=90)
+intent_router.add("單身貴族_小資族", keywords=["單身貴族_小資族"], priority=80)
+intent_router.add("單身貴族", keywords=["單身貴族"], priority=70)
+intent_router.add("青春活力_基本型", keywords=["青春活力_基本型"], priority=60)
+intent_router.add("青春活力", keywords=["青春活力"], priority=50)
+intent_router.add("適合性分析結果", keywords=["適合性分析結果"], priority=40)
+intent_router.add("人生保險規劃紀錄", keywords=["人生保險規劃紀錄"], priority=30)
+intent_router.add("人生保險規劃 退休規劃紀錄", keywords=["人生保險規劃 退休規劃紀錄"], priority=20)
+intent_router.add("回答問題", keywords=["ans:"], priority=10)
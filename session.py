@@ -0,0 +1,275 @@
+# -*- coding: utf8 -*-
+""" 使用者問卷進度暫存 """
+import atexit
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Text
+
+from pymongo.collection import Collection
+
+
+logger = logging.getLogger(__name__)
+
+# 問卷完成時寫入的欄位值
+COMPLETION_FIELDS = {"question_number": "0", "status": "0"}
+
+
+class Session():
+    """
+    class:
+        Session -- Hot copy of one user's `user-request` document
+
+        attribute:
+            document (Dict): user document, None if the user has none
+            dirty (Dict): fields changed since the last flush
+            dirty_since (float): monotonic time of the oldest unflushed change
+            used_at (float): monotonic time of the last use
+    """
+    __slots__ = ("document", "dirty", "dirty_since", "used_at")
+
+    def __init__(self, document: Optional[Dict]):
+        self.document = document
+        self.dirty = {}
+        self.dirty_since = None
+        self.used_at = time.monotonic()
+
+
+class SessionStore():
+    """
+    class:
+        SessionStore -- Process local LRU of user documents with write-behind
+
+        Reads are served from memory after the first load. A `$set` on the
+        cached document is applied in memory and written back to MongoDB:
+            step: on every change, the same writes as without the store
+            completion: when a questionnaire finishes (see COMPLETION_FIELDS),
+                after `flush_interval` seconds, on eviction and at exit
+
+        The copy is local to the process; run a single worker process or use
+        `step` when several processes serve the same users.
+
+        method:
+            get(user_id: Text, loader: Callable) -> Dict:
+                Cached document of the user, loaded on first use.
+
+            update(user_id: Text, filter: Dict, set_fields: Dict) -> bool:
+                Apply a `$set` in memory, False when it must go to MongoDB.
+
+            flush(user_id: Text = None, raise_errors: bool = False) -> int:
+                Write pending changes of one or all users.
+
+            discard(user_id: Text) -> None:
+                Flush and forget one user.
+
+            start() -> None:
+                Start the background flush thread.
+
+            shutdown() -> None:
+                Stop the background flush thread and flush everything.
+
+            stats() -> Dict:
+                Counters of the store.
+    """
+
+    def __init__(self, collection_getter: Callable[[], Collection], max_users: int = 1000,
+                 ttl: float = 1800, durability: Text = "step", flush_interval: float = 5.0):
+        """
+        Args:
+            collection_getter (Callable[[], Collection]): function returning the `user-request` collection
+            max_users (int, optional): users kept in memory. Defaults to 1000.
+            ttl (float, optional): seconds an unused user is kept, 0 means forever. Defaults to 1800.
+            durability (Text, optional): step or completion. Defaults to "step".
+            flush_interval (float, optional): longest delay of a pending change in completion mode, 0 means no timer. Defaults to 5.0.
+        """
+        if durability not in ("step", "completion"):
+            raise ValueError(f"Unknown session durability {durability}")
+        self.collection_getter = collection_getter
+        self.max_users = max_users
+        self.ttl = ttl
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self._sessions: "OrderedDict[Text, Session]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = False
+        self._counters = {"hits": 0, "misses": 0, "deferred": 0,
+                          "flushes": 0, "flush_errors": 0, "evictions": 0}
+
+    def _expired(self, session: Session, now: float) -> bool:
+        return self.ttl > 0 and now - session.used_at >= self.ttl
+
+    def get(self, user_id: Text, loader: Callable[[Text], Optional[Dict]]) -> Optional[Dict]:
+        """Cached document of the user, loaded on first use.
+
+        The returned document is shared and updated in place, do not modify it.
+
+        Args:
+            user_id (Text): event.source.user_id
+            loader (Callable[[Text], Optional[Dict]]): function reading the document from MongoDB
+
+        Returns:
+            Dict: user document, None if the user has none
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None and self._expired(session, now) and not session.dirty:
+                del self._sessions[user_id]
+                session = None
+            if session is not None:
+                self._sessions.move_to_end(user_id)
+                session.used_at = now
+                self._counters["hits"] += 1
+                return session.document
+            self._counters["misses"] += 1
+        document = loader(user_id)
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = self._sessions[user_id] = Session(document)
+            session.used_at = now
+            evicted = []
+            while len(self._sessions) > self.max_users:
+                evicted.append(self._sessions.popitem(last=False))
+                self._counters["evictions"] += 1
+        for evicted_user, evicted_session in evicted:
+            self._write(evicted_user, evicted_session)
+        return session.document
+
+    def update(self, user_id: Text, filter: Dict, set_fields: Dict) -> bool:
+        """Apply a `$set` in memory.
+
+        Args:
+            user_id (Text): event.source.user_id
+            filter (Dict): equality filter of the update
+            set_fields (Dict): fields of `$set`
+
+        Returns:
+            bool: True when applied, False when the update must go to MongoDB
+        """
+        self.start()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None or session.document is None:
+                return False
+            if any(session.document.get(key) != value for key, value in filter.items()):
+                return False
+            set_fields = copy.deepcopy(set_fields)
+            session.document.update(set_fields)
+            session.dirty.update(set_fields)
+            if session.dirty_since is None:
+                session.dirty_since = time.monotonic()
+            session.used_at = time.monotonic()
+            self._counters["deferred"] += 1
+            completed = any(set_fields.get(key) == value for key, value in COMPLETION_FIELDS.items())
+        if self.durability == "step" or completed:
+            self.flush(user_id, raise_errors=True)
+        return True
+
+    def _write(self, user_id: Text, session: Session, raise_errors: bool = False) -> bool:
+        with self._lock:
+            if not session.dirty:
+                return False
+            dirty, dirty_since = session.dirty, session.dirty_since
+            session.dirty, session.dirty_since = {}, None
+        try:
+            self.collection_getter().update_one(
+                {"user_id": user_id}, {"$set": dirty}, upsert=True)
+        except Exception:
+            with self._lock:
+                self._counters["flush_errors"] += 1
+                # 失敗時保留變更, 較新的值優先
+                dirty.update(session.dirty)
+                session.dirty = dirty
+                session.dirty_since = dirty_since
+                if user_id not in self._sessions:
+                    self._sessions[user_id] = session
+            logger.exception("Flush session of %s failed", user_id)
+            if raise_errors:
+                raise
+            return False
+        with self._lock:
+            self._counters["flushes"] += 1
+        return True
+
+    def flush(self, user_id: Text = None, raise_errors: bool = False) -> int:
+        """Write pending changes of one or all users.
+
+        A failed write keeps the changes and tries again on the next flush.
+
+        Args:
+            user_id (Text, optional): user to flush, all users if None. Defaults to None.
+            raise_errors (bool, optional): raise the error of a failed write. Defaults to False.
+
+        Returns:
+            int: number of users written
+        """
+        with self._lock:
+            if user_id is not None:
+                sessions = [(user_id, self._sessions[user_id])] if user_id in self._sessions else []
+            else:
+                sessions = [(key, session) for key, session in self._sessions.items() if session.dirty]
+        return sum(self._write(key, session, raise_errors) for key, session in sessions)
+
+    def discard(self, user_id: Text) -> None:
+        """Flush and forget one user.
+
+        Args:
+            user_id (Text): event.source.user_id
+        """
+        self.flush(user_id, raise_errors=True)
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def _flush_due(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = [user_id for user_id, session in self._sessions.items()
+                   if session.dirty_since is not None and now - session.dirty_since >= self.flush_interval]
+        for user_id in due:
+            self.flush(user_id)
+
+    def _run(self) -> None:
+        while not self._stop.wait(max(self.flush_interval / 2, 0.1)):
+            self._flush_due()
+
+    def start(self) -> None:
+        """Start the background flush thread.
+
+        Called on the first deferred change, so a gunicorn master loaded with
+        `--preload` never owns the thread.
+        """
+        if self.durability == "step":
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            if self.flush_interval > 0:
+                self._thread = threading.Thread(
+                    target=self._run, name="session-flush", daemon=True)
+                self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self) -> None:
+        """Stop the background flush thread and flush everything."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> Dict:
+        """Counters of the store.
+
+        Returns:
+            Dict: counters, users in memory and users with pending changes
+        """
+        with self._lock:
+            return dict(self._counters,
+                        users=len(self._sessions),
+                        dirty_users=sum(1 for session in self._sessions.values() if session.dirty),
+                        durability=self.durability)